@@ -0,0 +1,214 @@
+"""
+ Copyright (c) 2020 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import os
+import threading
+import tty
+
+from pymata4.private_constants import PrivateConstants
+
+"""
+A minimal FirmataExpress emulator attached to a pseudo terminal.
+
+The benchmarks in this directory use it in place of a real Arduino.
+Pass FakeBoard().port to Pymata4 as the com_port.
+"""
+
+
+class FakeBoard:
+    """
+    Emulate enough of FirmataExpress to satisfy the Pymata4 start up
+    sequence and answer the pin queries. Data reports are injected
+    by calling write().
+    """
+
+    def __init__(self, arduino_instance_id=1, number_of_digital_pins=20,
+                 number_of_analog_pins=6, firmware_name='FirmataExpress'):
+        """
+        :param arduino_instance_id: value returned in I_AM_HERE replies
+
+        :param number_of_digital_pins: total number of pins on the board
+
+        :param number_of_analog_pins: number of pins that are analog
+                                      capable. These are the last pins.
+
+        :param firmware_name: name returned in REPORT_FIRMWARE replies
+        """
+        self.arduino_instance_id = arduino_instance_id
+        self.number_of_digital_pins = number_of_digital_pins
+        self.number_of_analog_pins = number_of_analog_pins
+        self.firmware_name = firmware_name
+
+        # current mode and value of each pin, reported in pin state replies
+        self.pin_modes = [PrivateConstants.OUTPUT] * number_of_digital_pins
+        self.pin_values = [0] * number_of_digital_pins
+
+        # a list of every complete command received from the client
+        self.received_commands = []
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+        self.the_write_lock = threading.Lock()
+
+        self.running = True
+        self.the_command_thread = threading.Thread(target=self._command_handler)
+        self.the_command_thread.daemon = True
+        self.the_command_thread.start()
+
+    def write(self, data):
+        """
+        Send raw bytes to the client.
+
+        :param data: bytes or list of ints
+        """
+        data = bytes(data)
+        with self.the_write_lock:
+            view = memoryview(data)
+            while view:
+                sent = os.write(self.master, view)
+                view = view[sent:]
+
+    def close(self):
+        """
+        Stop the command handler and release the pseudo terminal.
+        """
+        self.running = False
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    @staticmethod
+    def analog_message(pin, value):
+        """
+        :returns: an encoded ANALOG_MESSAGE for the pin
+        """
+        return bytes([PrivateConstants.ANALOG_MESSAGE + pin, value & 0x7f,
+                      (value >> 7) & 0x7f])
+
+    @staticmethod
+    def digital_message(port, port_value):
+        """
+        :returns: an encoded DIGITAL_MESSAGE for the port
+        """
+        return bytes([PrivateConstants.DIGITAL_MESSAGE + port,
+                      port_value & 0x7f, (port_value >> 7) & 0x7f])
+
+    @staticmethod
+    def sysex(command, data=()):
+        """
+        :returns: an encoded sysex message
+        """
+        return bytes([PrivateConstants.START_SYSEX, command] + list(data) +
+                     [PrivateConstants.END_SYSEX])
+
+    def _reply(self, command, data=()):
+        self.write(self.sysex(command, data))
+
+    def _handle_sysex(self, command, data):
+        if command == PrivateConstants.ARE_YOU_THERE:
+            self._reply(PrivateConstants.I_AM_HERE, [self.arduino_instance_id])
+        elif command == PrivateConstants.REPORT_FIRMWARE:
+            name = []
+            for c in self.firmware_name:
+                name += [ord(c) & 0x7f, (ord(c) >> 7) & 0x7f]
+            self._reply(PrivateConstants.REPORT_FIRMWARE, [1, 2] + name)
+        elif command == PrivateConstants.ANALOG_MAPPING_QUERY:
+            first_analog = self.number_of_digital_pins - self.number_of_analog_pins
+            report = [PrivateConstants.IGNORE] * first_analog + \
+                list(range(self.number_of_analog_pins))
+            self._reply(PrivateConstants.ANALOG_MAPPING_RESPONSE, report)
+        elif command == PrivateConstants.CAPABILITY_QUERY:
+            first_analog = self.number_of_digital_pins - self.number_of_analog_pins
+            report = []
+            for pin in range(self.number_of_digital_pins):
+                report += [PrivateConstants.INPUT, 1, PrivateConstants.OUTPUT, 1,
+                           PrivateConstants.PULLUP, 1]
+                if pin >= first_analog:
+                    report += [PrivateConstants.ANALOG, 10]
+                else:
+                    report += [PrivateConstants.PWM, 8, PrivateConstants.SERVO, 14]
+                report.append(PrivateConstants.IGNORE)
+            self._reply(PrivateConstants.CAPABILITY_RESPONSE, report)
+        elif command == PrivateConstants.PIN_STATE_QUERY:
+            pin = data[0]
+            if pin < self.number_of_digital_pins:
+                value = self.pin_values[pin]
+                self._reply(PrivateConstants.PIN_STATE_RESPONSE,
+                            [pin, self.pin_modes[pin], value & 0x7f,
+                             (value >> 7) & 0x7f])
+
+    def _handle_command(self, command):
+        self.received_commands.append(command)
+        command_byte = command[0]
+        if command_byte == PrivateConstants.START_SYSEX:
+            self._handle_sysex(command[1], command[2:-1])
+        elif command_byte == PrivateConstants.SET_PIN_MODE:
+            if command[1] < self.number_of_digital_pins:
+                self.pin_modes[command[1]] = command[2]
+        elif command_byte == PrivateConstants.SET_DIGITAL_PIN_VALUE:
+            if command[1] < self.number_of_digital_pins:
+                self.pin_values[command[1]] = command[2]
+        elif command_byte == PrivateConstants.REPORT_VERSION:
+            self.write([PrivateConstants.REPORT_VERSION, 2, 5])
+        elif 0xe0 <= command_byte <= 0xef:
+            pin = command_byte & 0x0f
+            if pin < self.number_of_digital_pins:
+                self.pin_values[pin] = command[1] + (command[2] << 7)
+
+    @staticmethod
+    def _command_length(command_byte):
+        if command_byte in (PrivateConstants.SYSTEM_RESET,
+                            PrivateConstants.REPORT_VERSION):
+            return 1
+        if 0xc0 <= command_byte <= 0xdf:
+            return 2
+        return 3
+
+    def _command_handler(self):
+        """
+        Thread that frames and answers the commands sent by the client.
+        """
+        buffer = bytearray()
+        while self.running:
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                return
+            if not data:
+                return
+            buffer += data
+            while buffer:
+                if buffer[0] == PrivateConstants.START_SYSEX:
+                    end = buffer.find(PrivateConstants.END_SYSEX)
+                    if end < 0:
+                        break
+                    length = end + 1
+                elif buffer[0] < 0x80:
+                    # stray data byte
+                    del buffer[0]
+                    continue
+                else:
+                    length = self._command_length(buffer[0])
+                    if len(buffer) < length:
+                        break
+                command = bytes(buffer[:length])
+                del buffer[:length]
+                self._handle_command(command)
@@ -0,0 +1,79 @@
+"""
+ Copyright (c) 2020 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import sys
+import time
+
+from fake_board import FakeBoard
+from pymata4.firmata_parser import FirmataParser
+from pymata4.private_constants import PrivateConstants
+
+"""
+Measure FirmataParser throughput without a serial port.
+
+If a file name is given, its contents are used as a recorded capture
+of the bytes sent by a board. Otherwise a synthetic capture of analog,
+digital, sonar and i2c reports is generated.
+
+Usage: python parser_benchmark.py [capture_file]
+"""
+
+CHUNK_SIZES = [1, 16, 256, 4096]
+
+
+def synthetic_capture(number_of_messages=200000):
+    """
+    :returns: bytes of a mixed stream of board reports
+    """
+    capture = bytearray()
+    for i in range(number_of_messages):
+        kind = i % 10
+        if kind < 6:
+            capture += FakeBoard.analog_message(kind, i & 0x3ff)
+        elif kind < 8:
+            capture += FakeBoard.digital_message(kind - 6, i & 0xff)
+        elif kind == 8:
+            capture += FakeBoard.sysex(PrivateConstants.SONAR_DATA,
+                                       [12, i & 0x7f, (i >> 7) & 0x7f])
+        else:
+            capture += FakeBoard.sysex(PrivateConstants.I2C_REPLY,
+                                       [0x53, 0, 0x32, 0] + [i & 0x7f, 0] * 6)
+    return bytes(capture)
+
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'rb') as f:
+            capture = f.read()
+    else:
+        capture = synthetic_capture()
+
+    print(f'Capture size: {len(capture)} bytes')
+    for chunk_size in CHUNK_SIZES:
+        chunks = [capture[i:i + chunk_size] for i in range(0, len(capture), chunk_size)]
+        parser = FirmataParser()
+        number_of_messages = 0
+        start_time = time.perf_counter()
+        for chunk in chunks:
+            number_of_messages += len(parser.feed(chunk))
+        elapsed = time.perf_counter() - start_time
+        print(f'chunk size {chunk_size:>5}: {len(capture) / elapsed / 1000000:6.2f} MB/s, '
+              f'{number_of_messages / elapsed / 1000000:5.2f} M messages/s')
+
+
+if __name__ == '__main__':
+    main()
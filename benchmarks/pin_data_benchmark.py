@@ -0,0 +1,175 @@
+"""
+ Copyright (c) 2020 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import sys
+import threading
+import time
+
+from fake_board import FakeBoard
+from pymata4 import pymata4
+from pymata4.private_constants import PrivateConstants
+
+"""
+Measure the cost of handling digital and analog messages.
+
+The handlers of a connected Pymata4 instance are called directly and
+compared with a copy of the original implementation, in which every
+PinData property acquired the shared lock.
+
+Usage: python pin_data_benchmark.py [number_of_messages]
+"""
+
+
+class LegacyPinData:
+    """
+    The original PinData, with a locked property for every attribute.
+    """
+
+    def __init__(self, data_lock):
+        self.data_lock = data_lock
+        self._current_value = 0
+        self._event_time = 0
+        self._cb = None
+        self._differential = 1
+        self._pull_up = False
+
+    @property
+    def current_value(self):
+        with self.data_lock:
+            return self._current_value
+
+    @current_value.setter
+    def current_value(self, value):
+        with self.data_lock:
+            self._current_value = value
+
+    @property
+    def event_time(self):
+        with self.data_lock:
+            return self._event_time
+
+    @event_time.setter
+    def event_time(self, value):
+        with self.data_lock:
+            self._event_time = value
+
+    @property
+    def cb(self):
+        with self.data_lock:
+            return self._cb
+
+    @property
+    def differential(self):
+        with self.data_lock:
+            return self._differential
+
+    @property
+    def pull_up(self):
+        with self.data_lock:
+            return self._pull_up
+
+
+def legacy_digital_message(digital_pins, data):
+    """
+    The original _digital_message handler.
+    """
+    port = data[0]
+    port_data = (data[PrivateConstants.MSB] << 7) + data[PrivateConstants.LSB]
+    pin = port * 8
+    for pin in range(pin, min(pin + 8, len(digital_pins))):
+        value = port_data & 0x01
+        last_value = digital_pins[pin].current_value
+        if type(last_value) is list:
+            continue
+        digital_pins[pin].current_value = value
+        time_stamp = time.time()
+        digital_pins[pin].event_time = time_stamp
+        if digital_pins[pin].pull_up:
+            message = [PrivateConstants.PULLUP, pin, value, time_stamp]
+        else:
+            message = [PrivateConstants.INPUT, pin, value, time_stamp]
+        if last_value != value:
+            if digital_pins[pin].cb:
+                digital_pins[pin].cb(message)
+        port_data >>= 1
+
+
+def legacy_analog_message(analog_pins, data):
+    """
+    The original _analog_message handler.
+    """
+    pin = data[0]
+    value = (data[PrivateConstants.MSB] << 7) + data[PrivateConstants.LSB]
+    differential = abs(value - analog_pins[pin].current_value)
+    if differential >= analog_pins[pin].differential:
+        analog_pins[pin].current_value = value
+        time_stamp = time.time()
+        analog_pins[pin].event_time = time_stamp
+        message = [PrivateConstants.ANALOG, pin, value, time_stamp]
+        if analog_pins[pin].cb:
+            analog_pins[pin].cb(message)
+
+
+def time_it(handler, messages):
+    """
+    :returns: messages per second
+    """
+    start_time = time.perf_counter()
+    for message in messages:
+        handler(message)
+    return len(messages) / (time.perf_counter() - start_time)
+
+
+def main():
+    number_of_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    # alternate between two values so that every pin changes
+    digital_messages = [(0, 0x7f, 0x01) if i % 2 else (0, 0, 0)
+                        for i in range(number_of_messages)]
+    # a single chattering input
+    single_pin_messages = [(1, i % 2, 0) for i in range(number_of_messages)]
+    analog_messages = [(i % 6, i % 2 * 100, 0) for i in range(number_of_messages)]
+
+    lock = threading.Lock()
+    legacy_digital_pins = [LegacyPinData(lock) for _ in range(20)]
+    legacy_analog_pins = [LegacyPinData(lock) for _ in range(6)]
+
+    fake_board = FakeBoard()
+    board = pymata4.Pymata4(com_port=fake_board.port, arduino_wait=0)
+
+    results = [
+        ('digital', time_it(lambda m: legacy_digital_message(legacy_digital_pins, m),
+                            digital_messages),
+         time_it(board._digital_message, digital_messages)),
+        ('1 pin', time_it(lambda m: legacy_digital_message(legacy_digital_pins, m),
+                          single_pin_messages),
+         time_it(board._digital_message, single_pin_messages)),
+        ('analog', time_it(lambda m: legacy_analog_message(legacy_analog_pins, m),
+                           analog_messages),
+         time_it(board._analog_message, analog_messages))]
+
+    board.shutdown()
+    fake_board.close()
+
+    print(f'\n{number_of_messages} messages of each type')
+    for name, legacy, current in results:
+        print(f'{name:>8}: legacy {legacy:10,.0f} messages/s, '
+              f'current {current:10,.0f} messages/s, speedup {current / legacy:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+ Copyright (c) 2020 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import statistics
+import sys
+import threading
+import time
+
+from fake_board import FakeBoard
+from pymata4 import pymata4
+
+"""
+Measure the CPU consumed by an idle Pymata4 instance and the latency
+between a message being written by the board and its callback being
+invoked.
+
+Usage: python reporter_benchmark.py [idle_seconds] [number_of_samples]
+"""
+
+PIN = 2
+
+
+def main():
+    idle_seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    number_of_samples = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    fake_board = FakeBoard()
+    board = pymata4.Pymata4(com_port=fake_board.port, arduino_wait=0)
+
+    # idle cpu
+    start_time = time.perf_counter()
+    start_cpu = time.process_time()
+    time.sleep(idle_seconds)
+    idle_cpu = (time.process_time() - start_cpu) / (time.perf_counter() - start_time)
+
+    # callback latency
+    received = threading.Event()
+    callback_times = []
+
+    def the_callback(data):
+        callback_times.append(time.perf_counter())
+        received.set()
+
+    board.set_pin_mode_digital_input(PIN, the_callback)
+    latencies = []
+    for i in range(number_of_samples):
+        received.clear()
+        port_value = (i % 2 == 0) << PIN
+        sent = time.perf_counter()
+        fake_board.write(FakeBoard.digital_message(0, port_value))
+        if not received.wait(1):
+            print(f'sample {i} was not received')
+            continue
+        latencies.append((callback_times[-1] - sent) * 1000000)
+        time.sleep(.001)
+
+    board.shutdown()
+    fake_board.close()
+
+    latencies.sort()
+    print(f'\nIdle CPU: {idle_cpu * 100:.1f}% of one core over {idle_seconds} seconds')
+    print(f'Callback latency over {len(latencies)} samples (microseconds): '
+          f'median {statistics.median(latencies):.0f}, '
+          f'p99 {latencies[int(len(latencies) * .99) - 1]:.0f}, '
+          f'max {latencies[-1]:.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+ Copyright (c) 2020 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import sys
+import threading
+import time
+
+from fake_board import FakeBoard
+from pymata4 import pymata4
+
+"""
+Measure serial receive throughput against a pty backed fake board.
+
+A stream of analog messages is written to the pty as fast as possible
+and the time taken for every message to reach its callback is measured,
+once with bulk_receive enabled and once with the legacy single byte reads.
+
+Usage: python serial_receive_benchmark.py [number_of_messages]
+"""
+
+NUMBER_OF_PINS = 6
+
+
+def run(bulk_receive, number_of_messages):
+    """
+    :param bulk_receive: receive mode under test
+
+    :param number_of_messages: number of analog messages to stream
+
+    :returns: (elapsed seconds, cpu seconds)
+    """
+    fake_board = FakeBoard(number_of_analog_pins=NUMBER_OF_PINS)
+    board = pymata4.Pymata4(com_port=fake_board.port, arduino_wait=0,
+                            bulk_receive=bulk_receive)
+
+    done = threading.Event()
+    count = [0]
+
+    def the_callback(data):
+        count[0] += 1
+        if count[0] == number_of_messages:
+            done.set()
+
+    for pin in range(NUMBER_OF_PINS):
+        board.set_pin_mode_analog_input(pin, the_callback, differential=0)
+
+    # alternate the values so that every message is reported
+    stream = bytearray()
+    for i in range(number_of_messages):
+        stream += FakeBoard.analog_message(i % NUMBER_OF_PINS, (i // NUMBER_OF_PINS) % 2)
+
+    start_time = time.perf_counter()
+    start_cpu = time.process_time()
+    fake_board.write(stream)
+    done.wait(60)
+    elapsed = time.perf_counter() - start_time
+    cpu = time.process_time() - start_cpu
+
+    if count[0] != number_of_messages:
+        print(f'Only {count[0]} of {number_of_messages} messages were received')
+
+    board.shutdown()
+    fake_board.close()
+    return elapsed, cpu
+
+
+def main():
+    number_of_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    results = {}
+    for bulk_receive in (False, True):
+        results[bulk_receive] = run(bulk_receive, number_of_messages)
+
+    number_of_bytes = number_of_messages * 3
+    print(f'\n{number_of_messages} analog messages ({number_of_bytes} bytes)')
+    for bulk_receive, (elapsed, cpu) in results.items():
+        mode = 'bulk' if bulk_receive else 'single byte'
+        print(f'{mode:>12}: {elapsed:.3f} s elapsed, {cpu:.3f} s cpu, '
+              f'{number_of_bytes / elapsed:,.0f} bytes/s')
+
+
+if __name__ == '__main__':
+    main()
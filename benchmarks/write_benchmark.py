@@ -0,0 +1,93 @@
+"""
+ Copyright (c) 2020 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import sys
+import threading
+import time
+
+from fake_board import FakeBoard
+from pymata4 import pymata4
+
+"""
+Measure the cost of pwm_write calls made from several threads,
+with direct writes, with the writer thread and with per pin
+rate limits.
+
+Usage: python write_benchmark.py [writes_per_thread] [number_of_threads]
+"""
+
+PWM_PINS = [3, 5, 6, 9]
+
+
+def run(number_of_writes, number_of_threads, max_update_rate=None, **options):
+    """
+    :param max_update_rate: if set, a per pin rate limit is established
+
+    :returns: (seconds spent in the API calls, commands received by the board,
+               frames merged)
+    """
+    fake_board = FakeBoard()
+    board = pymata4.Pymata4(com_port=fake_board.port, arduino_wait=0, **options)
+    for pin in PWM_PINS:
+        board.set_pin_mode_pwm_output(pin)
+        if max_update_rate:
+            board.set_pwm_rate_limit(pin, max_update_rate)
+    received_before = len(fake_board.received_commands)
+
+    def control_loop(pin):
+        for value in range(number_of_writes):
+            board.pwm_write(pin, value & 0xff)
+
+    threads = [threading.Thread(target=control_loop,
+                                args=(PWM_PINS[i % len(PWM_PINS)],))
+               for i in range(number_of_threads)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start_time
+
+    board.shutdown()
+    # allow the board to process the last writes
+    time.sleep(.5)
+    received = len(fake_board.received_commands) - received_before
+    merged = board.get_write_statistics()['frames_merged']
+    fake_board.close()
+    return elapsed, received, merged
+
+
+def main():
+    number_of_writes = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    number_of_threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    configurations = {'direct': {},
+                      'writer thread': {'writer_thread': True},
+                      'latest value wins': {'writer_thread': True,
+                                            'latest_value_wins': True},
+                      'rate limit 100/s': {'max_update_rate': 100}}
+    results = {name: run(number_of_writes, number_of_threads, **options)
+               for name, options in configurations.items()}
+
+    total = number_of_writes * number_of_threads
+    print(f'\n{total} pwm_write calls from {number_of_threads} threads')
+    for name, (elapsed, received, merged) in results.items():
+        print(f'{name:>18}: {total / elapsed:10,.0f} calls/s, '
+              f'{received} commands reached the board, {merged} merged')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+ Copyright (c) 2020 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import asyncio
+import sys
+
+from pymata4 import pymata4_aio
+
+"""
+This file demonstrates analog input using the asyncio client.
+A callback may be a regular function or a coroutine.
+"""
+
+ANALOG_PIN = 2  # arduino pin number
+POLL_TIME = 5  # number of seconds between polls
+
+# Callback data indices
+CB_PIN_MODE = 0
+CB_PIN = 1
+CB_VALUE = 2
+CB_TIME = 3
+
+
+async def the_callback(data):
+    """
+    A callback coroutine to report data changes.
+
+    :param data: [pin_mode, pin, current_reported_value,  timestamp]
+    """
+    print(f'Analog Call Input Callback: pin={data[CB_PIN]}, '
+          f'Value={data[CB_VALUE]} (Raw Time={data[CB_TIME]})')
+
+
+async def analog_in(my_board, pin):
+    """
+    Establish the pin as an analog input and poll its last value
+    every POLL_TIME seconds.
+
+    :param my_board: a Pymata4Aio instance
+
+    :param pin: Arduino pin number
+    """
+    await my_board.start_aio()
+    print(f'Pin states: {await asyncio.gather(*[my_board.get_pin_state(p) for p in range(4)])}')
+    await my_board.set_pin_mode_analog_input(pin, callback=the_callback, differential=5)
+    while True:
+        await asyncio.sleep(POLL_TIME)
+        value, time_stamp = await my_board.analog_read(pin)
+        print(f'Reading latest analog input data for pin {pin} = {value} '
+              f'(Raw Time={time_stamp})')
+
+
+board = pymata4_aio.Pymata4Aio()
+loop = asyncio.new_event_loop()
+try:
+    loop.run_until_complete(analog_in(board, ANALOG_PIN))
+except KeyboardInterrupt:
+    loop.run_until_complete(board.shutdown())
+    sys.exit(0)
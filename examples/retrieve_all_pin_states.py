@@ -0,0 +1,53 @@
+"""
+ Copyright (c) 2020 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import sys
+
+from pymata4 import pymata4
+
+
+# This example retrieves the mode and state of every pin
+# on the board in a single pipelined scan
+
+
+def retrieve_all_pin_states(my_board):
+    """
+    Set a few pin modes and then retrieve the state of every pin.
+
+    :param my_board: a pymata4 instance
+    :return: No values returned by results are printed to console
+    """
+    my_board.set_pin_mode_pwm_output(9)
+    my_board.pwm_write(9, 127)
+    my_board.set_pin_mode_digital_output(6)
+
+    pin_states, elapsed_time = my_board.get_all_pin_states()
+    for pin, pin_state in pin_states.items():
+        if pin_state is None:
+            print(f'Pin {pin}: no reply')
+        else:
+            print(f'Pin {pin}: mode={pin_state[0]} state={pin_state[1]}')
+    print(f'Retrieved {len(pin_states)} pin states in {elapsed_time:.4f} seconds')
+
+
+board = pymata4.Pymata4()
+try:
+    retrieve_all_pin_states(board)
+    board.shutdown()
+except KeyboardInterrupt:
+    board.shutdown()
+    sys.exit(0)
@@ -0,0 +1,146 @@
+"""
+ Copyright (c) 2020 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+from pymata4.private_constants import PrivateConstants
+
+
+class FirmataParser:
+    """
+    An incremental parser for the data stream sent by a Firmata sketch.
+
+    Data is provided in arbitrarily sized chunks by calling feed().
+    Partial messages are retained between calls, and each call returns
+    the list of messages completed by the chunk.
+
+    Each message is a tuple of (command, data):
+
+        DIGITAL_MESSAGE: (0x90, (port, lsb, msb))
+
+        ANALOG_MESSAGE:  (0xE0, (pin, lsb, msb))
+
+        REPORT_VERSION:  (0xF9, (major, minor))
+
+        sysex messages:  (sysex_command, bytes between the sysex command
+                          and END_SYSEX)
+
+    The parser has no dependency on a serial port or socket.
+    """
+
+    # the number of data bytes that follow each non-sysex command
+    MESSAGE_LENGTHS = {PrivateConstants.DIGITAL_MESSAGE: 2,
+                       PrivateConstants.ANALOG_MESSAGE: 2,
+                       PrivateConstants.REPORT_VERSION: 2}
+
+    # a sysex message longer than this is considered corrupt and discarded
+    MAX_SYSEX_LENGTH = 4096
+
+    def __init__(self, sysex_commands=None):
+        """
+        :param sysex_commands: A container of the sysex commands to be
+                               decoded, such as the report_dispatch
+                               dictionary. Sysex messages with other
+                               commands are discarded. If None, all sysex
+                               messages are returned.
+        """
+        self.sysex_commands = sysex_commands
+
+        # unprocessed data carried over between calls to feed
+        self.buffer = bytearray()
+
+        # counts of data that could not be decoded
+        self.discarded_bytes = 0
+        self.discarded_messages = 0
+
+    def reset(self):
+        """
+        Discard any partially received message.
+        """
+        self.buffer.clear()
+
+    def feed(self, chunk):
+        """
+        Parse a chunk of received data.
+
+        :param chunk: bytes, bytearray or memoryview
+
+        :returns: A list of (command, data) tuples, one for each message
+                  completed by this chunk.
+        """
+        buffer = self.buffer
+        buffer += chunk
+        length = len(buffer)
+        messages = []
+        append = messages.append
+        message_lengths = self.MESSAGE_LENGTHS
+        sysex_commands = self.sysex_commands
+        start_sysex = PrivateConstants.START_SYSEX
+        end_sysex = PrivateConstants.END_SYSEX
+        position = 0
+
+        while position < length:
+            command = buffer[position]
+
+            if command == start_sysex:
+                end = buffer.find(end_sysex, position + 1)
+                if end < 0:
+                    if length - position > self.MAX_SYSEX_LENGTH:
+                        self.discarded_bytes += length - position
+                        position = length
+                    break
+                if end > position + 1:
+                    sysex_command = buffer[position + 1]
+                    if sysex_commands is None or sysex_command in sysex_commands:
+                        append((sysex_command, bytes(buffer[position + 2:end])))
+                    else:
+                        self.discarded_messages += 1
+                position = end + 1
+
+            elif command < 0x80:
+                # a data byte without a preceding command byte
+                self.discarded_bytes += 1
+                position += 1
+
+            else:
+                # digital and analog messages carry the port or pin
+                # in the low nibble of the command byte
+                if command < 0xf0:
+                    base_command = command & 0xf0
+                else:
+                    base_command = command
+                number_of_bytes = message_lengths.get(base_command)
+                if number_of_bytes is None:
+                    self.discarded_bytes += 1
+                    position += 1
+                    continue
+                if position + number_of_bytes >= length:
+                    break
+                lsb = buffer[position + 1]
+                msb = buffer[position + 2]
+                if (lsb | msb) & 0x80:
+                    # a command byte arrived before the message was
+                    # complete - resynchronize on it
+                    self.discarded_bytes += 1
+                    position += 1
+                    continue
+                if base_command == PrivateConstants.REPORT_VERSION:
+                    append((base_command, (lsb, msb)))
+                else:
+                    append((base_command, (command & 0x0f, lsb, msb)))
+                position += number_of_bytes + 1
+
+        del buffer[:position]
+        return messages
@@ -0,0 +1,139 @@
+"""
+ Copyright (c) 2020 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+from concurrent.futures import CancelledError, Future, TimeoutError
+import threading
+import time
+
+
+class PendingRequests:
+    """
+    A table of requests waiting for a reply from the board.
+
+    Requests are keyed by the reply command, or by (reply command, pin)
+    for replies that identify a pin. Several requests with the same key
+    may be outstanding and are resolved in the order they were made.
+
+    Each request is represented by a concurrent.futures.Future.
+    """
+
+    def __init__(self):
+        self.the_pending_lock = threading.Lock()
+
+        # key: list of [future, deadline]
+        self.pending = {}
+
+    def expect(self, key, timeout=None):
+        """
+        Register a request. This must be called before the request is
+        sent, so that a fast reply cannot be missed.
+
+        :param key: reply command or (reply command, pin)
+
+        :param timeout: Seconds after which the request is considered
+                        stale. A stale request fails with TimeoutError
+                        rather than consuming a later reply.
+                        None means never.
+
+        :returns: a Future resolved with the reply
+        """
+        future = Future()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.the_pending_lock:
+            self.pending.setdefault(key, []).append([future, deadline])
+        return future
+
+    def resolve(self, key, value):
+        """
+        Resolve the oldest outstanding request for the key.
+        Replies that nobody is waiting for are ignored.
+
+        :param key: reply command or (reply command, pin)
+
+        :param value: the reply
+
+        :returns: True if a request was resolved
+        """
+        now = time.monotonic()
+        with self.the_pending_lock:
+            entries = self.pending.get(key)
+            if not entries:
+                return False
+            while entries:
+                future, deadline = entries.pop(0)
+                # skip requests cancelled by the caller
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if deadline is not None and now > deadline:
+                    future.set_exception(TimeoutError())
+                    continue
+                future.set_result(value)
+                break
+            else:
+                future = None
+            if not entries:
+                del self.pending[key]
+        return future is not None
+
+    def discard(self, key, future):
+        """
+        Remove a request that is no longer of interest.
+
+        :param key: reply command or (reply command, pin)
+
+        :param future: future returned by expect
+        """
+        with self.the_pending_lock:
+            entries = self.pending.get(key)
+            if not entries:
+                return
+            for entry in entries:
+                if entry[0] is future:
+                    entries.remove(entry)
+                    break
+            if not entries:
+                del self.pending[key]
+        future.cancel()
+
+    def wait(self, key, future, timeout):
+        """
+        Wait for a request to be resolved.
+
+        :param key: reply command or (reply command, pin)
+
+        :param future: future returned by expect
+
+        :param timeout: seconds to wait
+
+        :returns: the reply or None if the timeout expired
+        """
+        try:
+            return future.result(timeout)
+        except (TimeoutError, CancelledError):
+            self.discard(key, future)
+            return None
+
+    def cancel_all(self):
+        """
+        Cancel every outstanding request. Used during shutdown.
+        """
+        with self.the_pending_lock:
+            pending = self.pending
+            self.pending = {}
+        for entries in pending.values():
+            for future, _ in entries:
+                future.cancel()
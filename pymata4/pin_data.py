@@ -23,69 +23,31 @@ class PinData:
     callback reference. It may also contain a callback differential that if met
     will cause a callback to occur. The differential pertains to non-digital
     inputs.
+
+    The attributes are plain slots. A writer that updates several
+    attributes, or several pins, holds data_lock for the whole update,
+    and readers use snapshot() to get a consistent value and time stamp.
     """
 
+    __slots__ = ('data_lock', 'current_value', 'event_time', 'cb',
+                 'differential', 'pull_up')
+
     def __init__(self, data_lock):
         self.data_lock = data_lock
         # current data value
-        self._current_value = 0
+        self.current_value = 0
         # time stamp of last change event
-        self._event_time = 0
+        self.event_time = 0
         # callback reference
-        self._cb = None
+        self.cb = None
         # analog differential
-        self._differential = 1
+        self.differential = 1
         # digital pin was set as a pullup pin
-        self._pull_up = False
-
-    @property
-    def current_value(self):
-        with self.data_lock:
-            return self._current_value
-
-    @current_value.setter
-    def current_value(self, value):
-        with self.data_lock:
-            self._current_value = value
-
-    @property
-    def event_time(self):
-        with self.data_lock:
-            return self._event_time
-
-    @event_time.setter
-    def event_time(self, value):
-        with self.data_lock:
-            self._event_time = value
-
-    @property
-    def cb(self):
-        with self.data_lock:
-            return self._cb
-
-    @cb.setter
-    def cb(self, value):
-        with self.data_lock:
-            self._cb = value
+        self.pull_up = False
 
-    @property
-    def differential(self):
+    def snapshot(self):
+        """
+        :returns: (current_value, event_time) as a consistent pair
+        """
         with self.data_lock:
-            return self._differential
-
-    @differential.setter
-    def differential(self, value):
-        with self.data_lock:
-            self._differential = value
-
-    @property
-    def pull_up(self):
-        with self.data_lock:
-            return self._pull_up
-
-    @pull_up.setter
-    def pull_up(self, value):
-        with self.data_lock:
-            self._pull_up = value
-
-
+            return self.current_value, self.event_time
@@ -29,8 +29,11 @@ import sys
 import threading
 import time
 
+from pymata4.firmata_parser import FirmataParser
+from pymata4.pending_requests import PendingRequests
 from pymata4.pin_data import PinData
 from pymata4.private_constants import PrivateConstants
+from pymata4.write_queue import WriteQueue
 
 
 # noinspection PyPep8
@@ -43,12 +46,16 @@ class Pymata4(threading.Thread):
 
     """
 
+    # seconds a serial write may make no progress before it fails
+    WRITE_STALL_TIMEOUT = 1
+
     # noinspection PyPep8,PyPep8,PyPep8
     def __init__(self, com_port=None, baud_rate=115200,
                  arduino_instance_id=1, arduino_wait=4,
                  sleep_tune=0.000001,
                  shutdown_on_exception=True, ip_address=None,
-                 ip_port=None):
+                 ip_port=None, bulk_receive=True, writer_thread=False,
+                 latest_value_wins=False):
         """
         If you are using the Firmata Express Arduino sketch,
         and have a single Arduino connected to your computer,
@@ -82,6 +89,23 @@ class Pymata4(threading.Thread):
         :param ip_port: Used with StandardFirmataWifi to specify IP port of
                            the WiFi device. Typically this is 3030
 
+        :param bulk_receive: If True, the serial receiver drains all of the
+                             bytes waiting in the input buffer with a single
+                             read, blocking on the port timeout when nothing
+                             is waiting. If False, bytes are read one at
+                             a time.
+
+        :param writer_thread: If True, commands are encoded and queued by
+                              the API methods, and a dedicated writer thread
+                              sends everything that is waiting in a single
+                              write.
+
+        :param latest_value_wins: Used with writer_thread. If True, a
+                                  pwm_write or servo_write replaces any
+                                  value for the same pin that is still
+                                  waiting to be sent. See also
+                                  set_pwm_rate_limit.
+
         """
         self.start_time = time.time()
         # initialize threading parent
@@ -116,6 +140,15 @@ class Pymata4(threading.Thread):
         self.the_keep_alive_thread = threading.Thread(target=self._send_keep_alive)
         self.the_keep_alive_thread.daemon = True
 
+        # the writer thread sends the commands queued here. It is created
+        # when writer_thread is set or a pwm rate limit is established.
+        self.the_write_queue = WriteQueue(latest_value_wins)
+        self.the_writer_thread = None
+        self.writer_thread = writer_thread
+
+        # True while the writer thread is accepting commands
+        self.writer_running = False
+
         # flag to allow the reporter and receive threads to run.
         self.run_event = threading.Event()
 
@@ -135,15 +168,21 @@ class Pymata4(threading.Thread):
         self.arduino_wait = arduino_wait
         self.sleep_tune = sleep_tune
         self.shutdown_on_exception = shutdown_on_exception
+        self.bulk_receive = bulk_receive
 
-        # create a deque to receive and process data from the arduino
+        # create a deque to receive and process data from the arduino.
+        # Each entry is a chunk of bytes as received.
         self.the_deque = deque()
 
+        # the receive threads notify the reporter through this condition
+        # when data is added to the deque
+        self.the_data_available = threading.Condition()
+
         # The report_dispatch dictionary is used to process
         # incoming report sysex message by looking up the sysex command
         # and executing its associated processing method.
-        # The value following the method is the number of bytes to
-        # retrieve from the deque to process the command.
+        # The value following the method is the number of bytes
+        # that follow the command for non-sysex messages.
         self.report_dispatch = {}
 
         # To add a command to the command dispatch table, append here.
@@ -168,6 +207,13 @@ class Pymata4(threading.Thread):
                                      None,
                                  PrivateConstants.PIN_STATE_RESPONSE: None}
 
+        # futures waiting for query replies
+        self.pending_requests = PendingRequests()
+
+        # frames the received data into messages for the report_dispatch
+        # handlers
+        self.the_parser = FirmataParser(self.report_dispatch)
+
         self.firmata_firmware = []
 
         # a flag to indicate if using FirmataExpress
@@ -184,6 +230,11 @@ class Pymata4(threading.Thread):
         # a list of pins assigned to DHT devices
         self.dht_list = []
 
+        # the last value reported for each digital port and the
+        # optional per port callbacks
+        self.digital_port_values = [0] * 16
+        self.digital_port_callbacks = [None] * 16
+
         # This lock is used when the PinData object is update or contents
         # are retrieved
         self.the_pin_data_lock = threading.Lock()
@@ -194,8 +245,8 @@ class Pymata4(threading.Thread):
         # a lock for the sonar map
         self.the_sonar_map_lock = threading.Lock()
 
-        # a when sending data to the arduino
-        self.the_send_sysex_lock = threading.Lock()
+        # serializes all writes to the arduino
+        self.the_send_lock = threading.Lock()
 
         # serial port in use
         self.serial_port = None
@@ -203,6 +254,9 @@ class Pymata4(threading.Thread):
         # handle to tcp/ip socket
         self.sock = None
 
+        # set by the tcp receiver when the board closes the connection
+        self.connection_lost = False
+
         # An i2c_map entry consists of a device i2c address as the key, and
         #  the value of the key consists of a dictionary containing 2 entries.
         #  The first entry. 'value' contains the last value reported, and
@@ -263,6 +317,8 @@ class Pymata4(threading.Thread):
 
         self.the_reporter_thread.start()
         self.the_data_receive_thread.start()
+        if self.writer_thread:
+            self._start_writer()
 
         # allow the threads to run
         self._run_threads()
@@ -453,7 +509,7 @@ class Pymata4(threading.Thread):
 
         :returns: A list = [last value change,  time_stamp]
         """
-        return self.analog_pins[pin].current_value, self.analog_pins[pin].event_time
+        return self.analog_pins[pin].snapshot()
 
     def dht_read(self, pin):
         """
@@ -467,9 +523,8 @@ class Pymata4(threading.Thread):
               are set to 0.0.
 
         """
-        return self.digital_pins[pin].current_value[0], \
-               self.digital_pins[pin].current_value[1], \
-               self.digital_pins[pin].event_time
+        current_value, event_time = self.digital_pins[pin].snapshot()
+        return current_value[0], current_value[1], event_time
 
     def digital_read(self, pin):
         """
@@ -480,7 +535,7 @@ class Pymata4(threading.Thread):
         :returns: A list = [last value change,  time_stamp]
 
         """
-        return [self.digital_pins[pin].current_value, self.digital_pins[pin].event_time]
+        return list(self.digital_pins[pin].snapshot())
 
     def digital_pin_write(self, pin, value):
         """
@@ -564,6 +619,28 @@ class Pymata4(threading.Thread):
         """
         self.set_pin_mode_analog_input(pin, callback, differential)
 
+    def set_digital_port_callback(self, port, callback=None):
+        """
+        Establish a callback that is invoked once per digital report for
+        a port in which at least one pin changed. It is called in
+        addition to any per pin callbacks, after them.
+
+        Digital reporting must be enabled for the port, for example by
+        setting one of its pins as a digital input.
+
+        callback returns a data list:
+
+        [pin_type, port, port_value, changed_mask, raw_time_stamp]
+
+        Bit n of port_value and changed_mask corresponds to
+        pin port * 8 + n. The pin_type is 0 (INPUT).
+
+        :param port: port number (pin // 8)
+
+        :param callback: callback function, or None to remove the callback
+        """
+        self.digital_port_callbacks[port] = callback
+
     def enable_digital_reporting(self, pin):
         """
         Enables digital reporting. By turning reporting on for all 8 bits
@@ -578,75 +655,117 @@ class Pymata4(threading.Thread):
                    PrivateConstants.REPORTING_ENABLE]
         self._send_command(command)
 
-    def get_analog_map(self):
+    def get_all_pin_states(self, pins=None, timeout=4, window=10):
+        """
+        Retrieve the mode and state of many pins at once.
+
+        The pin state queries are sent back to back without waiting for
+        each reply, and the replies are collected as they arrive. At most
+        window queries are outstanding at any time, so that the board's
+        serial input buffer is not overrun.
+
+        :param pins: an iterable of pin numbers. The default is every
+                     digital pin.
+
+        :param timeout: total number of seconds to wait for the replies
+
+        :param window: maximum number of outstanding queries
+
+        :returns: A tuple of ({pin: (mode, state)}, elapsed seconds).
+                  A pin that did not reply has a value of None.
+        """
+        if pins is None:
+            pins = range(len(self.digital_pins))
+        start_time = time.perf_counter()
+        deadline = start_time + timeout
+
+        pin_states = {}
+        outstanding = deque()
+        for pin in pins:
+            if len(outstanding) >= window:
+                self._collect_pin_state(outstanding.popleft(), pin_states, deadline)
+            outstanding.append((pin, self.request_pin_state(pin, timeout)))
+        while outstanding:
+            self._collect_pin_state(outstanding.popleft(), pin_states, deadline)
+
+        return pin_states, time.perf_counter() - start_time
+
+    def _collect_pin_state(self, request, pin_states, deadline):
+        """
+        Wait for a pin state query issued by get_all_pin_states and
+        store the decoded reply.
+
+        :param request: (pin, future)
+
+        :param pin_states: {pin: (mode, state)} being assembled
+
+        :param deadline: time.perf_counter() value after which
+                         the wait is abandoned
+        """
+        pin, future = request
+        report = self.pending_requests.wait((PrivateConstants.PIN_STATE_RESPONSE, pin),
+                                            future,
+                                            max(0, deadline - time.perf_counter()))
+        if report is None:
+            pin_states[pin] = None
+        else:
+            # the state is transmitted as 7 bit bytes, least significant first
+            state = 0
+            for index, value in enumerate(report[2:]):
+                state |= value << (7 * index)
+            pin_states[pin] = (report[1], state)
+
+    def get_analog_map(self, timeout=4):
         """
         This method requests a Firmata analog map query and returns the
         results.
 
+        :param timeout: seconds to wait for the reply
+
         :returns: An analog map response or None if a timeout occurs
         """
-        # get the current time to make sure a report is retrieved
-        current_time = time.time()
-
-        # if we do not have existing report results, send a Firmata
-        # message to request one
-
-        self._send_sysex(PrivateConstants.ANALOG_MAPPING_QUERY)
-        # wait for the report results to return for 4 seconds
-        # if the timer expires, return None
-        while self.query_reply_data.get(
-                PrivateConstants.ANALOG_MAPPING_RESPONSE) is None:
-            elapsed_time = time.time()
-            if elapsed_time - current_time > 4:
-                return None
-            # time.sleep(self.sleep_tune)
-            time.sleep(.01)
-        return self.query_reply_data.get(PrivateConstants.ANALOG_MAPPING_RESPONSE)
+        return self._query(PrivateConstants.ANALOG_MAPPING_RESPONSE,
+                           PrivateConstants.ANALOG_MAPPING_QUERY, timeout=timeout)
 
-    def get_capability_report(self):
+    def get_capability_report(self, timeout=4):
         """
         This method requests and returns a Firmata capability query report
 
-        :returns: A capability report in the form of a list
-        """
+        :param timeout: seconds to wait for the reply
 
-        self._send_sysex(PrivateConstants.CAPABILITY_QUERY)
-        while self.query_reply_data.get(
-                PrivateConstants.CAPABILITY_RESPONSE) is None:
-            time.sleep(self.sleep_tune)
-        return self.query_reply_data.get(PrivateConstants.CAPABILITY_RESPONSE)
+        :returns: A capability report in the form of a list or None
+                  if a timeout occurs
+        """
+        return self._query(PrivateConstants.CAPABILITY_RESPONSE,
+                           PrivateConstants.CAPABILITY_QUERY, timeout=timeout)
 
-    def get_firmware_version(self):
+    def get_firmware_version(self, timeout=4):
         """
         This method retrieves the Firmata firmware version
 
-        :returns: Firmata firmware version
-        """
-        self._send_sysex(PrivateConstants.REPORT_FIRMWARE)
+        :param timeout: seconds to wait for the reply
 
-        current_time = time.time()
-        while self.query_reply_data.get(PrivateConstants.REPORT_FIRMWARE) == '':
-            elapsed_time = time.time()
-            if elapsed_time - current_time > 4:
-                return None
-            time.sleep(self.sleep_tune)
-        return self.query_reply_data.get(PrivateConstants.REPORT_FIRMWARE)
+        :returns: Firmata firmware version or None if a timeout occurs
+        """
+        return self._query(PrivateConstants.REPORT_FIRMWARE,
+                           PrivateConstants.REPORT_FIRMWARE, timeout=timeout)
 
-    def get_protocol_version(self):
+    def get_protocol_version(self, timeout=4):
         """
         This method returns the major and minor values for the protocol
         version, i.e. 2.5
 
-        :returns: Firmata protocol version
+        :param timeout: seconds to wait for the reply
+
+        :returns: Firmata protocol version or None if a timeout occurs
         """
+        future = self.pending_requests.expect(PrivateConstants.REPORT_VERSION,
+                                              timeout)
         self._send_command([PrivateConstants.REPORT_VERSION])
-        while self.query_reply_data.get(
-                PrivateConstants.REPORT_VERSION) == '':
-            time.sleep(self.sleep_tune)
-        # v_major =
-        return self.query_reply_data.get(PrivateConstants.REPORT_VERSION)
+        return self.pending_requests.wait(PrivateConstants.REPORT_VERSION,
+                                          future, timeout)
 
-    def get_pin_state(self, pin):
+    def get_pin_state(self, pin, timeout=4):
         """
         This method retrieves a pin state report for the specified pin.
         Pin modes reported:
@@ -673,18 +792,58 @@ class Pymata4(threading.Thread):
 
         :param pin: Pin of interest
 
-        :returns: pin state report
+        :param timeout: seconds to wait for the reply
+
+        :returns: pin state report or None if a timeout occurs
 
         """
+        key = (PrivateConstants.PIN_STATE_RESPONSE, pin)
+        future = self.request_pin_state(pin, timeout)
+        return self.pending_requests.wait(key, future, timeout)
+
+    def request_pin_state(self, pin, timeout=4):
+        """
+        Send a pin state query without waiting for the reply.
+
+        Any number of queries may be outstanding, so the state of several
+        pins can be retrieved in a single round trip:
+
+            futures = [board.request_pin_state(pin) for pin in pins]
+
+            reports = [future.result(4) for future in futures]
+
+        :param pin: Pin of interest
+
+        :param timeout: Seconds after which an unanswered query is
+                        considered stale and is not resolved by a
+                        later reply.
+
+        :returns: a concurrent.futures.Future resolved with the
+                  pin state report
+        """
+        future = self.pending_requests.expect(
+            (PrivateConstants.PIN_STATE_RESPONSE, pin), timeout)
         # place pin in a list to keep _send_sysex happy
         self._send_sysex(PrivateConstants.PIN_STATE_QUERY, [pin])
-        while self.query_reply_data.get(
-                PrivateConstants.PIN_STATE_RESPONSE) is None:
-            time.sleep(self.sleep_tune)
-        pin_state_report = self.query_reply_data.get(
-            PrivateConstants.PIN_STATE_RESPONSE)
-        self.query_reply_data[PrivateConstants.PIN_STATE_RESPONSE] = None
-        return pin_state_report
+        return future
+
+    def _query(self, key, sysex_command, sysex_data=None, timeout=4):
+        """
+        Send a sysex query and wait for the reply.
+
+        :param key: reply key in the pending request table
+
+        :param sysex_command: query command
+
+        :param sysex_data: query data
+
+        :param timeout: seconds to wait for the reply
+
+        :returns: the reply or None if the timeout expired
+        """
+        future = self.pending_requests.expect(key, timeout)
+        self._send_sysex(sysex_command, sysex_data)
+        return self.pending_requests.wait(key, future, timeout)
 
     # noinspection PyMethodMayBeStatic
     def get_pymata_version(self):
@@ -991,14 +1150,16 @@ class Pymata4(threading.Thread):
         :param value: Pin value (0 - 0x4000)
 
         """
+        # the key allows the write queue to coalesce values for this pin
+        key = ('pwm', pin)
         if PrivateConstants.PWM_MESSAGE + pin < 0xf0:
             command = [PrivateConstants.PWM_MESSAGE + pin, value & 0x7f,
                        (value >> 7) & 0x7f]
-            self._send_command(command)
+            self._send_command(command, key)
         else:
-            self._pwm_write_extended(pin, value)
+            self._pwm_write_extended(pin, value, key)
 
-    def _pwm_write_extended(self, pin, data):
+    def _pwm_write_extended(self, pin, data, key=None):
         """
         This method will send an extended-data analog write command to the
         selected pin.
@@ -1007,11 +1168,60 @@ class Pymata4(threading.Thread):
 
         :param data: 0 - 0xfffff
 
+        :param key: write queue key
+
         :returns: No return value
         """
         pwm_data = [pin, data & 0x7f, (data >> 7) & 0x7f,
                     (data >> 14) & 0x7f]
-        self._send_sysex(PrivateConstants.EXTENDED_PWM, pwm_data)
+        self._send_sysex(PrivateConstants.EXTENDED_PWM, pwm_data, key)
+
+    def set_pwm_rate_limit(self, pin, max_update_rate):
+        """
+        Limit the rate at which pwm_write and servo_write values are
+        sent for a pin.
+
+        Values are held back so that at most max_update_rate values per
+        second are sent. When a value is due, only the most recent one
+        is sent, and the others are counted as merged
+        (see get_write_statistics). This keeps the serial link from
+        backing up when a control loop runs faster than the link or
+        the actuator can use.
+
+        This starts the writer thread if it is not already running.
+
+        :param pin: PWM or servo pin number
+
+        :param max_update_rate: maximum number of updates per second.
+                                None or 0 removes the limit.
+        """
+        self.the_write_queue.set_rate_limit(('pwm', pin), max_update_rate)
+        if max_update_rate and not self.writer_running and not self.shutdown_flag:
+            self._start_writer()
+
+    def get_write_statistics(self):
+        """
+        Retrieve write queue statistics. These are only maintained
+        while the writer thread is running.
+
+        :returns: A dictionary:
+
+                  frames_queued: number of commands queued
+
+                  frames_merged: number of commands discarded in favor
+                                 of a later value for the same pin
+
+                  batches: number of writes performed by the writer thread
+
+                  merged_by_pin: {pin: frames_merged}
+        """
+        write_queue = self.the_write_queue
+        with write_queue.the_write_condition:
+            return {'frames_queued': write_queue.frames_queued,
+                    'frames_merged': write_queue.frames_merged,
+                    'batches': write_queue.batches,
+                    'merged_by_pin': {key[1]: count for key, count in
+                                      write_queue.merged_by_key.items()}}
 
     def send_reset(self):
         """
@@ -1085,9 +1295,10 @@ class Pymata4(threading.Thread):
         # initialize it.
         if pin_number not in self.dht_list:
             self.dht_list.append(pin_number)
-            self.digital_pins[pin_number].cb = callback
-            self.digital_pins[pin_number].current_value = [0, 0]
-            self.digital_pins[pin_number].differential = differential
+            with self.the_pin_data_lock:
+                self.digital_pins[pin_number].cb = callback
+                self.digital_pins[pin_number].current_value = [0, 0]
+                self.digital_pins[pin_number].differential = differential
             data = [pin_number, sensor_type]
             self._send_sysex(PrivateConstants.DHT_CONFIG, data)
         else:
@@ -1295,11 +1506,13 @@ class Pymata4(threading.Thread):
             if pin_state == PrivateConstants.INPUT:
                 self.digital_pins[pin_number].cb = callback
             elif pin_state == PrivateConstants.PULLUP:
-                self.digital_pins[pin_number].cb = callback
-                self.digital_pins[pin_number].pull_up = True
+                with self.the_pin_data_lock:
+                    self.digital_pins[pin_number].cb = callback
+                    self.digital_pins[pin_number].pull_up = True
             elif pin_state == PrivateConstants.ANALOG:
-                self.analog_pins[pin_number].cb = callback
-                self.analog_pins[pin_number].differential = differential
+                with self.the_pin_data_lock:
+                    self.analog_pins[pin_number].cb = callback
+                    self.analog_pins[pin_number].differential = differential
             else:
                 print('{} {}'.format('set_pin_mode: callback ignored for '
                                      'pin state:', pin_state))
@@ -1356,6 +1569,12 @@ class Pymata4(threading.Thread):
 
         self._stop_threads()
 
+        # send anything still queued. Later writes go directly to the port.
+        self._stop_writer()
+
+        # release anybody waiting on a query
+        self.pending_requests.cancel_all()
+
         try:
             # stop all reporting - both analog and digital
             for pin in range(len(self.analog_pins)):
@@ -1436,7 +1655,9 @@ class Pymata4(threading.Thread):
         :param data: response data
 
         """
-        self.query_reply_data[PrivateConstants.ANALOG_MAPPING_RESPONSE] = data
+        self.query_reply_data[PrivateConstants.ANALOG_MAPPING_RESPONSE] = list(data)
+        self.pending_requests.resolve(PrivateConstants.ANALOG_MAPPING_RESPONSE,
+                                      list(data))
 
     def _analog_message(self, data):
         """
@@ -1448,19 +1669,20 @@ class Pymata4(threading.Thread):
         """
         pin = data[0]
         value = (data[PrivateConstants.MSB] << 7) + data[PrivateConstants.LSB]
+        pin_data = self.analog_pins[pin]
 
-        # only report when there is a change in value
-        differential = abs(value - self.analog_pins[pin].current_value)
-        if differential >= self.analog_pins[pin].differential:
-            self.analog_pins[pin].current_value = value
+        with self.the_pin_data_lock:
+            # only report when there is a change in value
+            if abs(value - pin_data.current_value) < pin_data.differential:
+                return
             time_stamp = time.time()
-            self.analog_pins[pin].event_time = time_stamp
+            pin_data.current_value = value
+            pin_data.event_time = time_stamp
+            cb = pin_data.cb
 
+        if cb:
             # append pin number, pin value, and pin type to return value and return as a list
-            message = [PrivateConstants.ANALOG, pin, value, time_stamp]
-
-            if self.analog_pins[pin].cb:
-                self.analog_pins[pin].cb(message)
+            cb([PrivateConstants.ANALOG, pin, value, time_stamp])
 
     def _capability_response(self, data):
         """
@@ -1470,7 +1692,9 @@ class Pymata4(threading.Thread):
         :param data: capability report
 
         """
-        self.query_reply_data[PrivateConstants.CAPABILITY_RESPONSE] = data
+        self.query_reply_data[PrivateConstants.CAPABILITY_RESPONSE] = list(data)
+        self.pending_requests.resolve(PrivateConstants.CAPABILITY_RESPONSE,
+                                      list(data))
 
     def _dht_read_response(self, data):
         """
@@ -1501,29 +1725,30 @@ class Pymata4(threading.Thread):
             if data[4]:
                 temperature *= -1.0
 
-        self.digital_pins[pin].event_time = time_stamp
         reply_data.append(data[2])
         reply_data.append(humidity)
         reply_data.append(temperature)
         reply_data.append(time_stamp)
 
-        # retrieve the last reported values
-        last_value = self.digital_pins[pin].current_value
+        pin_data = self.digital_pins[pin]
+        with self.the_pin_data_lock:
+            # retrieve the last reported values
+            last_value = pin_data.current_value
+            pin_data.current_value = [humidity, temperature]
+            pin_data.event_time = time_stamp
+            cb = pin_data.cb
+            differential = pin_data.differential
 
-        self.digital_pins[pin].current_value = [humidity, temperature]
-        if self.digital_pins[pin].cb:
+        if cb:
             # only report changes
             # has the humidity changed?
             if last_value[0] != humidity:
-
-                differential = abs(humidity - last_value[0])
-                if differential >= self.digital_pins[pin].differential:
-                    self.digital_pins[pin].cb(reply_data)
+                if abs(humidity - last_value[0]) >= differential:
+                    cb(reply_data)
                 return
             if last_value[1] != temperature:
-                differential = abs(temperature - last_value[1])
-                if differential >= self.digital_pins[pin].differential:
-                    self.digital_pins[pin].cb(reply_data)
+                if abs(temperature - last_value[1]) >= differential:
+                    cb(reply_data)
                 return
 
     def _digital_message(self, data):
@@ -1537,32 +1762,55 @@ class Pymata4(threading.Thread):
         port = data[0]
         # noinspection PyPep8
         port_data = (data[PrivateConstants.MSB] << 7) + data[PrivateConstants.LSB]
-        pin = port * 8
-        for pin in range(pin, min(pin + 8, len(self.digital_pins))):
-            # get pin value
-            value = port_data & 0x01
-
-            # retrieve previous value
-            last_value = self.digital_pins[pin].current_value
-            if type(last_value) is list:
-                continue
 
-            # set the current value in the pin structure
-            self.digital_pins[pin].current_value = value
-            time_stamp = time.time()
-            self.digital_pins[pin].event_time = time_stamp
+        # only the pins whose bits changed need to be visited
+        changed_mask = port_data ^ self.digital_port_values[port]
+        if not changed_mask:
+            return
+        self.digital_port_values[port] = port_data
 
-            # append pin number, pin value, and pin type to return value and return as a list
-            if self.digital_pins[pin].pull_up:
-                message = [PrivateConstants.PULLUP, pin, value, time_stamp]
-            else:
-                message = [PrivateConstants.INPUT, pin, value, time_stamp]
+        first_pin = port * 8
+        number_of_pins = len(self.digital_pins)
+        time_stamp = time.time()
+
+        # callbacks are collected while the pins are updated and
+        # invoked after the lock is released
+        callbacks = []
+        changed = changed_mask
+        with self.the_pin_data_lock:
+            while changed:
+                # isolate the lowest changed bit
+                lowest_bit = changed & -changed
+                changed ^= lowest_bit
+                pin = first_pin + lowest_bit.bit_length() - 1
+                if pin >= number_of_pins:
+                    break
+
+                pin_data = self.digital_pins[pin]
+
+                # DHT pins hold a list and are skipped
+                if type(pin_data.current_value) is list:
+                    continue
+
+                value = 1 if port_data & lowest_bit else 0
+                pin_data.current_value = value
+                pin_data.event_time = time_stamp
 
-            if last_value != value:
-                if self.digital_pins[pin].cb:
-                    self.digital_pins[pin].cb(message)
+                if pin_data.cb:
+                    # append pin number, pin value, and pin type to return value
+                    # and return as a list
+                    if pin_data.pull_up:
+                        message = [PrivateConstants.PULLUP, pin, value, time_stamp]
+                    else:
+                        message = [PrivateConstants.INPUT, pin, value, time_stamp]
+                    callbacks.append((pin_data.cb, message))
 
-            port_data >>= 1
+        for cb, message in callbacks:
+            cb(message)
+
+        port_cb = self.digital_port_callbacks[port]
+        if port_cb:
+            port_cb([PrivateConstants.INPUT, port, port_data, changed_mask, time_stamp])
 
     # noinspection PyDictCreation
 
@@ -1617,7 +1865,9 @@ class Pymata4(threading.Thread):
         :param data: Pin state message
 
         """
-        self.query_reply_data[PrivateConstants.PIN_STATE_RESPONSE] = data
+        self.query_reply_data[PrivateConstants.PIN_STATE_RESPONSE] = list(data)
+        self.pending_requests.resolve((PrivateConstants.PIN_STATE_RESPONSE, data[0]),
+                                      list(data))
 
     def _report_firmware(self, sysex_data):
         """
@@ -1666,6 +1916,8 @@ class Pymata4(threading.Thread):
 
         # store the value
         self.query_reply_data[PrivateConstants.REPORT_FIRMWARE] = version_string
+        self.pending_requests.resolve(PrivateConstants.REPORT_FIRMWARE,
+                                      version_string)
 
     def _report_version(self, data):
         """
@@ -1680,28 +1932,121 @@ class Pymata4(threading.Thread):
         """
         version_string = str(data[0]) + '.' + str(data[1])
         self.query_reply_data[PrivateConstants.REPORT_VERSION] = version_string
+        self.pending_requests.resolve(PrivateConstants.REPORT_VERSION,
+                                      version_string)
 
-    def _send_command(self, command):
+    def _send_command(self, command, key=None):
         """
         This is a private utility method.
         The method sends a non-sysex command to Firmata.
 
+        If the writer thread is running, the command is queued for it.
+
         :param command:  command data
 
-        :returns: number of bytes sent
+        :param key: Optional write queue key. A queued command with the
+                    same key is discarded.
+
+        :returns: number of bytes sent or queued
         """
-        # send_message = ""
+        if self.connection_lost:
+            raise RuntimeError('write fail in _send_command: connection lost')
         send_message = bytes(command)
-        if not self.ip_address:
+        if self.writer_running:
+            self.the_write_queue.put(send_message, key)
+            if self.writer_running:
+                return len(send_message)
+            # the writer stopped before it took the command,
+            # so send it here with anything else still waiting
+            self.the_write_queue.flush_held()
+            send_message = self.the_write_queue.get_batch(0)
+        try:
+            with self.the_send_lock:
+                return self._write(send_message)
+        except (SerialException, OSError):
+            if self.shutdown_on_exception and not self.shutdown_flag:
+                self.shutdown()
+            raise RuntimeError('write fail in _send_command')
+
+    def _write(self, data):
+        """
+        Write data to the serial port or socket. The caller must hold
+        the_send_lock.
+
+        :param data: bytes to send
+
+        :returns: number of bytes sent
+        """
+        if self.ip_address:
+            self.sock.sendall(data)
+            return len(data)
+        sent = self.serial_port.write(data)
+        # the port is opened non-blocking, so a large write
+        # may only be partially accepted. Give up if the port
+        # accepts nothing for a while.
+        deadline = time.monotonic() + self.WRITE_STALL_TIMEOUT
+        while sent is not None and sent < len(data):
+            time.sleep(.0005)
+            accepted = self.serial_port.write(data[sent:])
+            if accepted:
+                sent += accepted
+                deadline = time.monotonic() + self.WRITE_STALL_TIMEOUT
+            elif time.monotonic() > deadline:
+                raise SerialException(f'write stalled after {sent} of {len(data)} bytes')
+        return sent
+
+    def _writer(self):
+        """
+        This is the writer thread. It sends the commands queued by
+        _send_command, joining everything that is waiting into a single
+        write.
+        """
+        while True:
+            running = self.writer_running
+            batch = self.the_write_queue.get_batch(1 if running else 0)
+            if batch:
+                try:
+                    with self.the_send_lock:
+                        self._write(batch)
+                except (SerialException, OSError) as e:
+                    print(f'pymata4: writer thread stopped: {e}')
+                    self.writer_running = False
+                    return
+            elif not running:
+                return
+
+    def _start_writer(self):
+        """
+        Start the writer thread. Commands are queued from now on.
+        """
+        self.the_writer_thread = threading.Thread(target=self._writer)
+        self.the_writer_thread.daemon = True
+        self.writer_running = True
+        self.the_writer_thread.start()
+
+    def _stop_writer(self):
+        """
+        Stop accepting queued commands and wait for the writer thread
+        to send anything that is still waiting, including values held
+        back by a rate limit.
+        """
+        if not self.writer_running:
+            return
+        self.writer_running = False
+        self.the_write_queue.flush_held()
+        self.the_write_queue.wake()
+        if self.the_writer_thread is not threading.current_thread():
+            self.the_writer_thread.join(2)
+
+        # send commands queued after the writer thread last looked
+        self.the_write_queue.flush_held()
+        batch = self.the_write_queue.get_batch(0)
+        if batch:
             try:
-                result = self.serial_port.write(send_message)
-            except SerialException:
-                if self.shutdown_on_exception:
-                    self.shutdown()
-                raise RuntimeError('write fail in _send_command')
-            return result
-        else:
-            self.sock.sendall(send_message)
+                with self.the_send_lock:
+                    self._write(batch)
+            except (SerialException, OSError):
+                pass
 
     def _send_keep_alive(self):
         """
@@ -1753,7 +2098,7 @@ class Pymata4(threading.Thread):
                 self.active_sonar_map[pin_number] = sonar_pin_entry
         time.sleep(self.sleep_tune)
 
-    def _send_sysex(self, sysex_command, sysex_data=None):
+    def _send_sysex(self, sysex_command, sysex_data=None, key=None):
         """
         This is a private utility method.
         This method sends a sysex command to Firmata.
@@ -1762,6 +2107,8 @@ class Pymata4(threading.Thread):
 
         :param sysex_data: data for command
 
+        :param key: Optional write queue key. See _send_command.
+
         """
         if not sysex_data:
             sysex_data = []
@@ -1771,8 +2118,7 @@ class Pymata4(threading.Thread):
             for d in sysex_data:
                 the_command.append(d)
         the_command.append(PrivateConstants.END_SYSEX)
-        with self.the_send_sysex_lock:
-            self._send_command(the_command)
+        self._send_command(the_command, key)
 
     # noinspection PyMethodMayBeStatic
     def _string_data(self, data):
@@ -1799,102 +2145,60 @@ class Pymata4(threading.Thread):
 
     def _stop_threads(self):
         self.run_event.clear()
+        # wake up the reporter so that it can exit
+        with self.the_data_available:
+            self.the_data_available.notify_all()
+
+    def _data_received(self):
+        """
+        Notify the reporter that data was placed on the deque.
+        """
+        with self.the_data_available:
+            self.the_data_available.notify()
+
+    def _next_chunk(self):
+        """
+        Retrieve the next chunk of received data from the deque.
+        If the deque is empty, block until a receive thread signals
+        that data has arrived.
+
+        :returns: next chunk or None if the threads have been stopped
+        """
+        while True:
+            try:
+                return self.the_deque.popleft()
+            except IndexError:
+                with self.the_data_available:
+                    while not self.the_deque:
+                        if not self._is_running() or self.shutdown_flag:
+                            return None
+                        self.the_data_available.wait(1)
 
     def _reporter(self):
         """
         This is the reporter thread. It continuously pulls data from
-        the deque. When a full message is detected, that message is
-        processed.
+        the deque and feeds it to the parser. Each complete message
+        is passed to its report_dispatch handler. When the deque is
+        empty, the thread blocks until a receive thread signals that
+        data has arrived.
         """
         self.run_event.wait()
 
-        # sysex commands are assembled into this list for processing
-        # next_command_byte = None
         while self._is_running() and not self.shutdown_flag:
-            if len(self.the_deque):
-
-                # get next byte from the deque and process it
-                data = self.the_deque.popleft()
-
-                # this list will be populated with the received data for the command
-                response_data = []
-
-                # process sysex commands
-                if data == PrivateConstants.START_SYSEX:
-                    # next char is the actual sysex command
-                    # wait until we can get data from the deque
-                    while len(self.the_deque) == 0:
-                        pass
-                    sysex_command = self.the_deque.popleft()
-                    # retrieve the associated command_dispatch entry for this command
-                    dispatch_entry = self.report_dispatch.get(sysex_command)
-
-                    # get a "pointer" to the method that will process this command
-                    method = dispatch_entry[0]
-
-                    # now get the rest of the data excluding the END_SYSEX byte
-                    end_of_sysex = False
-                    while not end_of_sysex:
-                        # wait for more data to arrive
-                        while len(self.the_deque) == 0:
-                            pass
-                        data = self.the_deque.popleft()
-                        if data != PrivateConstants.END_SYSEX:
-                            response_data.append(data)
-                        else:
-                            end_of_sysex = True
-
-                            # invoke the method to process the command
-                            method(response_data)
-                            # go to the beginning of the loop to process the next command
-                    continue
-
-                # is this a command byte in the range of 0x80-0xff - these are the non-sysex messages
-
-                elif 0x80 <= data <= 0xff:
-                    # look up the method for the command in the command dispatch table
-                    # for the digital reporting the command value is modified with port number
-                    # the handler needs the port to properly process, so decode that from the command and
-                    # place in response_data
-                    if 0x90 <= data <= 0x9f:
-                        port = data & 0xf
-                        response_data.append(port)
-                        data = 0x90
-                    # the pin number for analog data is embedded in the command so, decode it
-                    elif 0xe0 <= data <= 0xef:
-                        pin = data & 0xf
-                        response_data.append(pin)
-                        data = 0xe0
-                    else:
-                        pass
-
-                    dispatch_entry = self.report_dispatch.get(data)
-
-                    # this calls the method retrieved from the dispatch table
-                    method = dispatch_entry[0]
-
-                    # get the number of parameters that this command provides
-                    num_args = dispatch_entry[1]
-
-                    # look at the number of args that the selected method requires
-                    # now get that number of bytes to pass to the called method
-                    for i in range(num_args):
-                        while len(self.the_deque) == 0:
-                            pass
-                        data = self.the_deque.popleft()
-                        response_data.append(data)
-                        # go execute the command with the argument list
-                    method(response_data)
-
-                    # go to the beginning of the loop to process the next command
-                    continue
-            else:
-                time.sleep(self.sleep_tune)
+            chunk = self._next_chunk()
+            if chunk is None:
+                break
+            for command, data in self.the_parser.feed(chunk):
+                self.report_dispatch[command][0](data)
 
     def _serial_receiver(self):
         """
         Thread to continuously check for incoming data.
-        When a byte comes in, place it onto the deque.
+        When data comes in, place it onto the deque.
+
+        In bulk_receive mode, every byte waiting in the input buffer
+        is retrieved with a single read. If nothing is waiting, the read
+        blocks until data arrives or the serial port timeout expires.
         """
         self.run_event.wait()
 
@@ -1902,9 +2206,15 @@ class Pymata4(threading.Thread):
             # we can get an OSError: [Errno9] Bad file descriptor when shutting down
             # just ignore it
             try:
-                if self.serial_port.inWaiting():
+                if self.bulk_receive:
+                    chunk = self.serial_port.read(max(1, self.serial_port.in_waiting))
+                    if chunk:
+                        self.the_deque.append(chunk)
+                        self._data_received()
+                elif self.serial_port.inWaiting():
                     c = self.serial_port.read()
-                    self.the_deque.append(ord(c))
+                    self.the_deque.append(c)
+                    self._data_received()
                 else:
                     time.sleep(self.sleep_tune)
                     # continue
@@ -1914,12 +2224,41 @@ class Pymata4(threading.Thread):
     def _tcp_receiver(self):
         """
         Thread to continuously check for incoming data.
-        When a byte comes in, place it onto the deque.
+        When data comes in, place it onto the deque.
+
+        Data is received into a preallocated buffer, so that everything
+        the socket has available is retrieved with a single call.
+        An empty read means that the board closed the connection.
         """
         self.run_event.wait()
+
+        receive_buffer = bytearray(4096)
+        receive_view = memoryview(receive_buffer)
         while self._is_running() and not self.shutdown_flag:
             try:
-                payload = self.sock.recv(1)
-                self.the_deque.append(ord(payload))
-            except Exception:
-                pass
+                number_of_bytes = self.sock.recv_into(receive_buffer)
+            except OSError as e:
+                # errors are expected when the socket is closed by shutdown
+                if self.shutdown_flag:
+                    break
+                self._tcp_connection_lost(e)
+                break
+            if not number_of_bytes:
+                if not self.shutdown_flag:
+                    self._tcp_connection_lost()
+                break
+            self.the_deque.append(bytes(receive_view[:number_of_bytes]))
+            self._data_received()
+
+    def _tcp_connection_lost(self, exc=None):
+        """
+        The board closed the connection or the socket failed.
+        Stop the threads and release anybody waiting on a query.
+        Subsequent writes raise a RuntimeError.
+
+        :param exc: the exception raised by the socket, if any
+        """
+        self.connection_lost = True
+        print(f'pymata4: connection to {self.ip_address}:{self.ip_port} was lost {exc or ""}')
+        self._stop_threads()
+        self.pending_requests.cancel_all()
@@ -0,0 +1,1317 @@
+"""
+ Copyright (c) 2020 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import serial
+# noinspection PyPackageRequirements
+from serial.tools import list_ports
+# noinspection PyPackageRequirements
+from serial.serialutil import SerialException
+
+from pymata4.firmata_parser import FirmataParser
+from pymata4.pin_data import PinData
+from pymata4.private_constants import PrivateConstants
+
+
+class _FirmataProtocol(asyncio.Protocol):
+    """
+    Receives data from an asyncio transport and hands it to the
+    parser of the owning Pymata4Aio instance.
+
+    I_AM_HERE replies are resolved here, since during discovery they
+    must be matched to the port they arrived on.
+    """
+
+    def __init__(self, board):
+        self.board = board
+        self.parser = FirmataParser(board.report_dispatch)
+        self.i_am_here_futures = []
+
+    def data_received(self, data):
+        dispatch = self.board.report_dispatch
+        for command, message in self.parser.feed(data):
+            if command == PrivateConstants.I_AM_HERE:
+                while self.i_am_here_futures:
+                    future = self.i_am_here_futures.pop(0)
+                    if not future.done():
+                        future.set_result(message[0])
+                        break
+            else:
+                dispatch[command][0](message)
+
+    def connection_lost(self, exc):
+        self.board._connection_lost(self, exc)
+
+
+class Pymata4Aio:
+    """
+    This class exposes the pymata4 API using asyncio.
+
+    All data is received and written using asyncio transports, so no
+    threads are created. Any number of instances may share a single
+    event loop.
+
+    The public methods mirror those of Pymata4 and are coroutines.
+    Queries resolve as soon as the reply arrives.
+
+    Serial connections require a POSIX platform.
+    """
+
+    def __init__(self, com_port=None, baud_rate=115200,
+                 arduino_instance_id=1, arduino_wait=4,
+                 shutdown_on_exception=True, ip_address=None,
+                 ip_port=None):
+        """
+        If you are using the Firmata Express Arduino sketch,
+        and have a single Arduino connected to your computer,
+        then you may accept all the default values.
+
+        If you are using some other Firmata sketch, then
+        you must specify both the com_port and baudrate for
+        as serial connection, or ip_address and ip_port if
+        using StandardFirmataWifi.
+
+        No I/O is performed until start_aio is awaited.
+
+        :param com_port: e.g. COM3 or /dev/ttyACM0.
+
+        :param baud_rate: Match this to the Firmata sketch in use.
+
+        :param arduino_instance_id: If you are using the Firmata
+                                    Express sketch, match this
+                                    value to that in the sketch.
+
+        :param arduino_wait: Amount of time to wait for an Arduino to
+                             fully reset itself.
+
+        :param shutdown_on_exception: call shutdown before raising
+                                      a RunTimeError exception
+
+        :param ip_address: Used with StandardFirmataWifi to specify IP address of
+                           the WiFi device
+
+        :param ip_port: Used with StandardFirmataWifi to specify IP port of
+                           the WiFi device. Typically this is 3030
+        """
+        # check to make sure that Python interpreter is version 3.7 or greater
+        if sys.version_info < (3, 7):
+            raise RuntimeError("ERROR: Python 3.7 or greater is "
+                               "required for use of this program.")
+
+        self.com_port = com_port
+        self.baud_rate = baud_rate
+        self.arduino_instance_id = arduino_instance_id
+        self.arduino_wait = arduino_wait
+        self.shutdown_on_exception = shutdown_on_exception
+        self.ip_address = ip_address
+        self.ip_port = ip_port
+
+        # The report_dispatch dictionary is used to process
+        # incoming report messages by looking up the command
+        # and executing its associated processing method.
+        self.report_dispatch = {}
+        self.report_dispatch.update({PrivateConstants.REPORT_VERSION: [self._report_version, 2]})
+        self.report_dispatch.update({PrivateConstants.REPORT_FIRMWARE: [self._report_firmware, 1]})
+        self.report_dispatch.update({PrivateConstants.ANALOG_MESSAGE: [self._analog_message, 2]})
+        self.report_dispatch.update({PrivateConstants.DIGITAL_MESSAGE: [self._digital_message, 2]})
+        self.report_dispatch.update({PrivateConstants.SONAR_DATA: [self._sonar_data, 3]})
+        self.report_dispatch.update({PrivateConstants.STRING_DATA: [self._string_data, 2]})
+        self.report_dispatch.update({PrivateConstants.I2C_REPLY: [self._i2c_reply, 2]})
+        self.report_dispatch.update({PrivateConstants.CAPABILITY_RESPONSE: [self._capability_response, 2]})
+        self.report_dispatch.update({PrivateConstants.PIN_STATE_RESPONSE: [self._pin_state_response, 2]})
+        self.report_dispatch.update({PrivateConstants.ANALOG_MAPPING_RESPONSE: [self._analog_mapping_response, 4]})
+        self.report_dispatch.update({PrivateConstants.DHT_DATA: [self._dht_read_response, 7]})
+        # I_AM_HERE replies are resolved by the protocol
+        self.report_dispatch.update({PrivateConstants.I_AM_HERE: [None, 1]})
+
+        # Futures waiting for query replies. The key is the reply
+        # command, or (reply command, pin) for pin state queries, and
+        # the value is a list of futures resolved in order of arrival.
+        self.pending_replies = {}
+
+        self.using_firmata_express = False
+        self.firmware_version = None
+
+        # lists of PinData objects - one for each pin segregated by pin type
+        self.analog_pins = []
+        self.digital_pins = []
+        self.first_analog_pin = None
+
+        # a list of pins assigned to DHT devices
+        self.dht_list = []
+
+        # the last value reported for each digital port and the
+        # optional per port callbacks
+        self.digital_port_values = [0] * 16
+        self.digital_port_callbacks = [None] * 16
+
+        # i2c address: {'value': [data], 'callback': cb, 'time_stamp': ts}
+        self.i2c_map = {}
+
+        # sonar trigger pin: [callback, current_data_returned, time_stamp]
+        self.active_sonar_map = {}
+
+        # the last value written to each digital output port
+        self.digital_output_port_pins = [0] * 16
+
+        # PinData requires a lock. All access happens on the event loop.
+        self.the_pin_data_lock = threading.Lock()
+
+        self.transport = None
+        self.write_transport = None
+        self.protocol = None
+        self.serial_port = None
+
+        self.keep_alive_task = None
+        self.keep_alive_interval = []
+        self.period = 0
+        self.margin = 0
+
+        self.loop = None
+        self.shutdown_flag = False
+
+    async def start_aio(self):
+        """
+        Connect to the board, retrieve its firmware version and
+        analog map, and build the pin lists.
+        """
+        self.loop = asyncio.get_running_loop()
+
+        print(f"pymata4:  Version {PrivateConstants.PYMATA_EXPRESS_THREADED_VERSION}\n\n"
+              f"Copyright (c) 2020 Alan Yorinks All Rights Reserved.\n")
+
+        try:
+            if self.ip_address:
+                self.transport, self.protocol = await self.loop.create_connection(
+                    lambda: _FirmataProtocol(self), self.ip_address, self.ip_port)
+                self.write_transport = self.transport
+                print(f'Successfully connected to: {self.ip_address}:{self.ip_port}')
+            elif self.com_port:
+                await self._manual_open()
+            else:
+                await self._find_arduino()
+        except RuntimeError:
+            await self._shutdown_on_error()
+            raise
+        except (SerialException, OSError) as e:
+            await self._shutdown_on_error()
+            raise RuntimeError(f'No Arduino Found: {e}')
+
+        print('\nRetrieving Arduino Firmware ID...')
+        firmware_version = await self.get_firmware_version()
+        if not firmware_version:
+            await self._shutdown_on_error()
+            raise RuntimeError('Firmata Sketch Firmware Version Not Found')
+        if self.using_firmata_express:
+            version_number = firmware_version[0:3]
+            if version_number != PrivateConstants.FIRMATA_EXPRESS_VERSION:
+                await self._shutdown_on_error()
+                raise RuntimeError(f'You must use FirmataExpress version 1.2. '
+                                   f'Version Found = {version_number}')
+        print(f'Arduino Firmware ID: {firmware_version}')
+
+        print('\nRetrieving analog map...')
+        report = await self.get_analog_map()
+        if not report:
+            await self._shutdown_on_error()
+            raise RuntimeError('*** Analog map retrieval timed out. ***'
+                               '\nDo you have Arduino connectivity and do you have the '
+                               'correct Firmata sketch uploaded to the board?')
+
+        for pin in report:
+            self.digital_pins.append(PinData(self.the_pin_data_lock))
+            if pin != PrivateConstants.IGNORE:
+                self.analog_pins.append(PinData(self.the_pin_data_lock))
+        self.first_analog_pin = len(self.digital_pins) - len(self.analog_pins)
+        print(f'Auto-discovery complete. Found {len(self.digital_pins)} Digital Pins'
+              f' and {len(self.analog_pins)} Analog Pins\n\n')
+
+        # Set the sampling interval to the standard value
+        # so the the DHT and HC-SRO4 device report at the right
+        # time frame.
+        await self.set_sampling_interval(19)
+
+    async def _shutdown_on_error(self):
+        if self.shutdown_on_exception:
+            await self.shutdown()
+
+    async def _open_serial(self, device):
+        """
+        Open a serial port and attach read and write transports to it.
+
+        :param device: serial device name
+
+        :returns: (serial port, read transport, write transport, protocol)
+        """
+        if os.name != 'posix':
+            raise RuntimeError('Pymata4Aio serial connections require a POSIX platform')
+
+        serial_port = serial.Serial(device, self.baud_rate, timeout=0,
+                                    writeTimeout=0)
+        serial_port.reset_input_buffer()
+        serial_port.reset_output_buffer()
+
+        try:
+            read_transport, protocol = await self.loop.connect_read_pipe(
+                lambda: _FirmataProtocol(self), serial_port)
+            # the write transport gets its own descriptor so that closing
+            # one transport does not affect the other
+            write_file = os.fdopen(os.dup(serial_port.fileno()), 'wb', buffering=0)
+            write_transport, _ = await self.loop.connect_write_pipe(
+                asyncio.BaseProtocol, write_file)
+        except OSError:
+            serial_port.close()
+            raise
+        return serial_port, read_transport, write_transport, protocol
+
+    def _use_serial(self, serial_port, read_transport, write_transport, protocol):
+        self.serial_port = serial_port
+        self.transport = read_transport
+        self.write_transport = write_transport
+        self.protocol = protocol
+
+    async def _are_you_there(self, protocol, write_transport, timeout=1):
+        """
+        Send an ARE_YOU_THERE request and wait for the I_AM_HERE reply.
+
+        :param protocol: protocol receiving data for the port
+
+        :param write_transport: transport to send the request on
+
+        :param timeout: seconds to wait for the reply
+
+        :returns: arduino instance id or None if no reply was received
+        """
+        future = self.loop.create_future()
+        protocol.i_am_here_futures.append(future)
+        write_transport.write(bytes([PrivateConstants.START_SYSEX,
+                                     PrivateConstants.ARE_YOU_THERE,
+                                     PrivateConstants.END_SYSEX]))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def _find_arduino(self):
+        """
+        Open every potential serial port and ask each of them for its
+        arduino_instance_id. The port with a matching id is kept and the
+        others are closed.
+
+        This is used explicitly with the FirmataExpress sketch.
+        """
+        print('Opening all potential serial ports...')
+        candidates = []
+        for port in list_ports.comports():
+            if port.pid is None:
+                continue
+            try:
+                candidates.append(await self._open_serial(port.device))
+            except (SerialException, OSError):
+                continue
+            print('\t' + port.device)
+
+        print(f'\nWaiting {self.arduino_wait} seconds(arduino_wait) for Arduino devices to '
+              'reset...')
+        await asyncio.sleep(self.arduino_wait)
+
+        print(f'\nSearching for an Arduino configured with an arduino_instance = {self.arduino_instance_id}')
+        replies = await asyncio.gather(*[self._are_you_there(candidate[3], candidate[2])
+                                         for candidate in candidates])
+        selected = None
+        for candidate, instance_id in zip(candidates, replies):
+            if selected is None and instance_id == self.arduino_instance_id:
+                selected = candidate
+            else:
+                candidate[1].close()
+                candidate[2].close()
+
+        if selected is None:
+            raise RuntimeError('arduino_instance_id does not match '
+                               'a value on the boards.')
+        self._use_serial(*selected)
+        self.using_firmata_express = True
+        self.com_port = self.serial_port.port
+        print(f"Arduino compatible device found and connected to {self.com_port}")
+
+    async def _manual_open(self):
+        """
+        Com port was specified by the user - try to open up that port
+        """
+        print(f'Opening {self.com_port}...')
+        self._use_serial(*await self._open_serial(self.com_port))
+
+        print(f'\nWaiting {self.arduino_wait} seconds(arduino_wait) for Arduino devices to '
+              'reset...')
+        await asyncio.sleep(self.arduino_wait)
+
+        if self.baud_rate == 115200:
+            instance_id = await self._are_you_there(self.protocol, self.write_transport)
+            if instance_id is None:
+                raise RuntimeError('Retrieving ID From Arduino Failed.')
+            if instance_id != self.arduino_instance_id:
+                raise RuntimeError('Invalid Arduino identifier retrieved')
+        print(f"Arduino compatible device found and connected to {self.com_port}")
+
+    async def analog_read(self, pin):
+        """
+        Retrieve the last data update for the specified analog pin.
+
+        :param pin: Analog pin number (ex. A2 is specified as 2)
+
+        :returns: A list = [last value change,  time_stamp]
+        """
+        return self.analog_pins[pin].current_value, self.analog_pins[pin].event_time
+
+    async def dht_read(self, pin):
+        """
+        Retrieve the last data update for the specified dht pin.
+
+        :param pin: digital pin number
+
+        :return: A list = [humidity, temperature  time_stamp]
+        """
+        return self.digital_pins[pin].current_value[0], \
+            self.digital_pins[pin].current_value[1], \
+            self.digital_pins[pin].event_time
+
+    async def digital_read(self, pin):
+        """
+        Retrieve the last data update for the specified digital pin.
+
+        :param pin: Digital pin number
+
+        :returns: A list = [last value change,  time_stamp]
+        """
+        return [self.digital_pins[pin].current_value, self.digital_pins[pin].event_time]
+
+    async def digital_pin_write(self, pin, value):
+        """
+        Set the specified pin to the specified value directly without port manipulation.
+
+        :param pin: arduino pin number
+
+        :param value: pin value
+        """
+        await self._send_command((PrivateConstants.SET_DIGITAL_PIN_VALUE, pin, value))
+
+    async def digital_write(self, pin, value):
+        """
+        Set the specified pin to the specified value.
+
+        :param pin: arduino pin number
+
+        :param value: pin value (1 or 0)
+        """
+        port = pin // 8
+        mask = 1 << (pin % 8)
+        if value == 1:
+            self.digital_output_port_pins[port] |= mask
+        else:
+            self.digital_output_port_pins[port] &= ~mask
+        port_value = self.digital_output_port_pins[port]
+        await self._send_command((PrivateConstants.DIGITAL_MESSAGE + port,
+                                  port_value & 0x7f, (port_value >> 7) & 0x7f))
+
+    async def disable_analog_reporting(self, pin):
+        """
+        Disables analog reporting for a single analog pin.
+
+        :param pin: Analog pin number. For example for A0, the number is 0.
+        """
+        await self.set_pin_mode_digital_input(pin + self.first_analog_pin)
+
+    async def disable_digital_reporting(self, pin):
+        """
+        Disables digital reporting. By turning reporting off for this pin,
+        Reporting is disabled for all 8 bits in the "port"
+
+        :param pin: Pin and all pins for this port
+        """
+        await self._send_command([PrivateConstants.REPORT_DIGITAL + pin // 8,
+                                  PrivateConstants.REPORTING_DISABLE])
+
+    async def enable_analog_reporting(self, pin, callback=None, differential=1):
+        """
+        Enables analog reporting. This is an alias for set_pin_mode_analog_input.
+
+        :param pin: Analog pin number. For example for A0, the number is 0.
+
+        :param callback: callback function
+
+        :param differential: This value needs to be met for a callback
+                             to be invoked.
+        """
+        await self.set_pin_mode_analog_input(pin, callback, differential)
+
+    async def set_digital_port_callback(self, port, callback=None):
+        """
+        Establish a callback that is invoked once per digital report for
+        a port in which at least one pin changed.
+
+        callback returns a data list:
+
+        [pin_type, port, port_value, changed_mask, raw_time_stamp]
+
+        :param port: port number (pin // 8)
+
+        :param callback: callback function or coroutine, or None to
+                         remove the callback
+        """
+        self.digital_port_callbacks[port] = callback
+
+    async def enable_digital_reporting(self, pin):
+        """
+        Enables digital reporting for all 8 bits in the "port".
+
+        :param pin: Pin and all pins for this port
+        """
+        await self._send_command([PrivateConstants.REPORT_DIGITAL + pin // 8,
+                                  PrivateConstants.REPORTING_ENABLE])
+
+    async def get_all_pin_states(self, pins=None, timeout=4, window=10):
+        """
+        Retrieve the mode and state of many pins at once.
+
+        The pin state queries are pipelined with at most window
+        queries outstanding at any time.
+
+        :param pins: an iterable of pin numbers. The default is every
+                     digital pin.
+
+        :param timeout: total number of seconds to wait for the replies
+
+        :param window: maximum number of outstanding queries
+
+        :returns: A tuple of ({pin: (mode, state)}, elapsed seconds).
+                  A pin that did not reply has a value of None.
+        """
+        if pins is None:
+            pins = range(len(self.digital_pins))
+        start_time = time.perf_counter()
+        deadline = start_time + timeout
+        semaphore = asyncio.Semaphore(window)
+
+        async def query(pin):
+            async with semaphore:
+                report = await self.get_pin_state(
+                    pin, max(0, deadline - time.perf_counter()))
+            if report is None:
+                return pin, None
+            state = 0
+            for index, value in enumerate(report[2:]):
+                state |= value << (7 * index)
+            return pin, (report[1], state)
+
+        pin_states = dict(await asyncio.gather(*[query(pin) for pin in pins]))
+        return pin_states, time.perf_counter() - start_time
+
+    async def get_analog_map(self, timeout=4):
+        """
+        This method requests a Firmata analog map query and returns the
+        results.
+
+        :param timeout: seconds to wait for the reply
+
+        :returns: An analog map response or None if a timeout occurs
+        """
+        return await self._query(PrivateConstants.ANALOG_MAPPING_RESPONSE,
+                                 PrivateConstants.ANALOG_MAPPING_QUERY, timeout=timeout)
+
+    async def get_capability_report(self, timeout=4):
+        """
+        This method requests and returns a Firmata capability query report
+
+        :param timeout: seconds to wait for the reply
+
+        :returns: A capability report in the form of a list or None if a
+                  timeout occurs
+        """
+        return await self._query(PrivateConstants.CAPABILITY_RESPONSE,
+                                 PrivateConstants.CAPABILITY_QUERY, timeout=timeout)
+
+    async def get_firmware_version(self, timeout=4):
+        """
+        This method retrieves the Firmata firmware version
+
+        :param timeout: seconds to wait for the reply
+
+        :returns: Firmata firmware version or None if a timeout occurs
+        """
+        self.firmware_version = await self._query(PrivateConstants.REPORT_FIRMWARE,
+                                                  PrivateConstants.REPORT_FIRMWARE,
+                                                  timeout=timeout)
+        return self.firmware_version
+
+    async def get_protocol_version(self, timeout=4):
+        """
+        This method returns the major and minor values for the protocol
+        version, i.e. 2.5
+
+        :param timeout: seconds to wait for the reply
+
+        :returns: Firmata protocol version or None if a timeout occurs
+        """
+        future = self._expect_reply(PrivateConstants.REPORT_VERSION)
+        await self._send_command([PrivateConstants.REPORT_VERSION])
+        return await self._wait_for_reply(PrivateConstants.REPORT_VERSION, future, timeout)
+
+    async def get_pin_state(self, pin, timeout=4):
+        """
+        This method retrieves a pin state report for the specified pin.
+        See Pymata4.get_pin_state for the pin modes reported.
+
+        Several queries may be outstanding at the same time.
+
+        :param pin: Pin of interest
+
+        :param timeout: seconds to wait for the reply
+
+        :returns: pin state report or None if a timeout occurs
+        """
+        return await self._query((PrivateConstants.PIN_STATE_RESPONSE, pin),
+                                 PrivateConstants.PIN_STATE_QUERY, [pin], timeout)
+
+    # noinspection PyMethodMayBeStatic
+    async def get_pymata_version(self):
+        """
+        This method retrieves the pymata4 version number
+
+        :returns: pymata4 version number.
+        """
+        return PrivateConstants.PYMATA_EXPRESS_THREADED_VERSION
+
+    async def i2c_read_saved_data(self, address):
+        """
+        This method retrieves cached i2c data to support a polling mode.
+
+        :param address: I2C device address
+
+        :returns data: [raw data returned from i2c device, time-stamp]
+        """
+        map_entry = self.i2c_map.get(address)
+        if map_entry:
+            return map_entry.get('value')
+        return None
+
+    async def i2c_read(self, address, register, number_of_bytes,
+                       callback=None):
+        """
+        Read the specified number of bytes from the specified register for
+        the i2c device.
+
+        :param address: i2c device address
+
+        :param register: i2c register (or None if no register selection is needed)
+
+        :param number_of_bytes: number of bytes to be read
+
+        :param callback: Optional callback function to report i2c data as a
+                   result of read command
+        """
+        await self._i2c_read_request(address, register, number_of_bytes,
+                                     PrivateConstants.I2C_READ, callback)
+
+    async def i2c_read_continuous(self, address, register, number_of_bytes,
+                                  callback=None):
+        """
+        Enable continuous reads for i2c devices that support it.
+
+        :param address: i2c device address
+
+        :param register: i2c register (or None if no register selection is needed)
+
+        :param number_of_bytes: number of bytes to be read
+
+        :param callback: Optional callback function to report i2c data as a
+                   result of read command
+        """
+        await self._i2c_read_request(address, register, number_of_bytes,
+                                     PrivateConstants.I2C_READ_CONTINUOUSLY,
+                                     callback)
+
+    async def i2c_read_restart_transmission(self, address, register,
+                                            number_of_bytes,
+                                            callback=None):
+        """
+        Read the specified number of bytes from the specified register for
+        the i2c device and restart the transmission after the read.
+
+        :param address: i2c device address
+
+        :param register: i2c register (or None if no register
+                                                    selection is needed)
+
+        :param number_of_bytes: number of bytes to be read
+
+        :param callback: Optional callback function to report i2c data as a
+                   result of read command
+        """
+        await self._i2c_read_request(address, register, number_of_bytes,
+                                     PrivateConstants.I2C_READ
+                                     | PrivateConstants.I2C_END_TX_MASK,
+                                     callback)
+
+    async def _i2c_read_request(self, address, register, number_of_bytes, read_type,
+                                callback=None):
+        if address not in self.i2c_map:
+            self.i2c_map[address] = {'value': None, 'callback': callback}
+        if register is not None:
+            data = [address, read_type, register & 0x7f, (register >> 7) & 0x7f,
+                    number_of_bytes & 0x7f, (number_of_bytes >> 7) & 0x7f]
+        else:
+            data = [address, read_type,
+                    number_of_bytes & 0x7f, (number_of_bytes >> 7) & 0x7f]
+        await self._send_sysex(PrivateConstants.I2C_REQUEST, data)
+
+    async def i2c_write(self, address, args):
+        """
+        Write data to an i2c device.
+
+        :param address: i2c device address
+
+        :param args: A variable number of bytes to be sent to the device
+                     passed in as a list
+        """
+        data = [address, PrivateConstants.I2C_WRITE]
+        for item in args:
+            data.append(item & 0x7f)
+            data.append((item >> 7) & 0x7f)
+        await self._send_sysex(PrivateConstants.I2C_REQUEST, data)
+
+    async def keep_alive(self, period=1, margin=.3):
+        """
+        This is a FirmataExpress feature.
+
+        Periodically send a keep alive message to the Arduino.
+
+        :param period: Time period between keepalives. Range is 0-10 seconds.
+                       0 disables the keepalive mechanism.
+
+        :param margin: Safety margin to assure keepalives are sent before
+                    period expires. Range is 0.1 to 0.9
+        """
+        self.period = min(max(period, 0), 10)
+        self.margin = min(max(margin, .1), .9)
+        self.keep_alive_interval = [self.period & 0x7f, (self.period >> 7) & 0x7f]
+        await self._send_sysex(PrivateConstants.SAMPLING_INTERVAL,
+                               self.keep_alive_interval)
+        if self.period and not self.keep_alive_task:
+            self.keep_alive_task = self.loop.create_task(self._send_keep_alive())
+
+    async def _send_keep_alive(self):
+        while self.period and not self.shutdown_flag:
+            await self._send_sysex(PrivateConstants.KEEP_ALIVE,
+                                   self.keep_alive_interval)
+            await asyncio.sleep(self.period - self.margin)
+        self.keep_alive_task = None
+
+    async def play_tone(self, pin_number, frequency, duration):
+        """
+        This is FirmataExpress feature
+
+        Play a tone at the specified frequency for the specified duration.
+
+        :param pin_number: arduino pin number
+
+        :param frequency: tone frequency in hz
+
+        :param duration: duration in milliseconds
+        """
+        await self._play_tone(pin_number, PrivateConstants.TONE_TONE,
+                              frequency=frequency, duration=duration)
+
+    async def play_tone_continuously(self, pin_number, frequency):
+        """
+        This is a FirmataExpress feature
+
+        This method plays a tone continuously until play_tone_off is called.
+
+        :param pin_number: arduino pin number
+
+        :param frequency: tone frequency in hz
+        """
+        await self._play_tone(pin_number, PrivateConstants.TONE_TONE,
+                              frequency=frequency, duration=None)
+
+    async def play_tone_off(self, pin_number):
+        """
+        This is a FirmataExpress Feature
+
+        This method turns tone off for the specified pin.
+
+        :param pin_number: arduino pin number
+        """
+        await self._play_tone(pin_number, PrivateConstants.TONE_NO_TONE,
+                              frequency=None, duration=None)
+
+    async def _play_tone(self, pin, tone_command, frequency, duration):
+        if tone_command == PrivateConstants.TONE_TONE:
+            if duration:
+                data = [tone_command, pin, frequency & 0x7f,
+                        (frequency >> 7) & 0x7f,
+                        duration & 0x7f, (duration >> 7) & 0x7f]
+            else:
+                data = [tone_command, pin,
+                        frequency & 0x7f, (frequency >> 7) & 0x7f, 0, 0]
+        else:
+            data = [tone_command, pin]
+        await self._send_sysex(PrivateConstants.TONE_DATA, data)
+
+    async def pwm_write(self, pin, value):
+        """
+        Set the selected pwm pin to the specified value.
+
+        :param pin: PWM pin number
+
+        :param value: Pin value (0 - 0x4000)
+        """
+        if PrivateConstants.PWM_MESSAGE + pin < 0xf0:
+            await self._send_command([PrivateConstants.PWM_MESSAGE + pin, value & 0x7f,
+                                      (value >> 7) & 0x7f])
+        else:
+            await self._send_sysex(PrivateConstants.EXTENDED_PWM,
+                                   [pin, value & 0x7f, (value >> 7) & 0x7f,
+                                    (value >> 14) & 0x7f])
+
+    async def send_reset(self):
+        """
+        Send a Sysex reset command to the arduino
+        """
+        await self._send_command([PrivateConstants.SYSTEM_RESET])
+
+    async def set_pin_mode_analog_input(self, pin_number, callback=None,
+                                        differential=1):
+        """
+        Set a pin as an analog input.
+
+        :param pin_number: arduino pin number
+
+        :param callback: callback function or coroutine
+
+        :param differential: This value needs to be met for a callback
+                             to be invoked.
+
+        callback returns a data list:
+
+        [pin_type, pin_number, pin_value, raw_time_stamp]
+        """
+        await self._set_pin_mode(pin_number, PrivateConstants.ANALOG,
+                                 callback=callback, differential=differential)
+
+    async def set_pin_mode_dht(self, pin_number, sensor_type=22, differential=.1,
+                               callback=None):
+        """
+        Configure a DHT sensor prior to operation.
+        Up to 6 DHT sensors are supported
+
+        :param pin_number: digital pin number on arduino.
+
+        :param sensor_type: type of dht sensor
+                            Valid values = DHT11, DHT22,
+
+        :param differential: This value needs to be met for a callback
+                             to be invoked.
+
+        :param callback: callback function or coroutine
+        """
+        if pin_number not in self.dht_list:
+            self.dht_list.append(pin_number)
+            self.digital_pins[pin_number].cb = callback
+            self.digital_pins[pin_number].current_value = [0, 0]
+            self.digital_pins[pin_number].differential = differential
+            await self._send_sysex(PrivateConstants.DHT_CONFIG, [pin_number, sensor_type])
+        else:
+            self.digital_pins[pin_number].differential = differential
+
+    async def set_pin_mode_digital_input(self, pin_number, callback=None):
+        """
+        Set a pin as a digital input.
+
+        :param pin_number: arduino pin number
+
+        :param callback: callback function or coroutine
+        """
+        await self._set_pin_mode(pin_number, PrivateConstants.INPUT, callback)
+
+    async def set_pin_mode_digital_input_pullup(self, pin_number, callback=None):
+        """
+        Set a pin as a digital input with pullup enabled.
+
+        :param pin_number: arduino pin number
+
+        :param callback: callback function or coroutine
+        """
+        await self._set_pin_mode(pin_number, PrivateConstants.PULLUP, callback)
+
+    async def set_pin_mode_digital_output(self, pin_number):
+        """
+        Set a pin as a digital output pin.
+
+        :param pin_number: arduino pin number
+        """
+        await self._set_pin_mode(pin_number, PrivateConstants.OUTPUT)
+
+    async def set_pin_mode_i2c(self, read_delay_time=0):
+        """
+        Establish the standard Arduino i2c pins for i2c utilization.
+
+        :param read_delay_time (in microseconds): an optional parameter,
+                                                  default is 0
+        """
+        await self._send_sysex(PrivateConstants.I2C_CONFIG,
+                               [read_delay_time & 0x7f, (read_delay_time >> 7) & 0x7f])
+
+    async def set_pin_mode_pwm_output(self, pin_number):
+        """
+        Set a pin as a pwm (analog output) pin.
+
+        :param pin_number:arduino pin number
+        """
+        await self._set_pin_mode(pin_number, PrivateConstants.PWM)
+
+    async def set_pin_mode_servo(self, pin, min_pulse=544, max_pulse=2400):
+        """
+        Configure a pin as a servo pin. Set pulse min, max in ms.
+
+        :param pin: Servo Pin.
+
+        :param min_pulse: Min pulse width in ms.
+
+        :param max_pulse: Max pulse width in ms.
+        """
+        await self._send_sysex(PrivateConstants.SERVO_CONFIG,
+                               [pin, min_pulse & 0x7f, (min_pulse >> 7) & 0x7f,
+                                max_pulse & 0x7f, (max_pulse >> 7) & 0x7f])
+
+    async def set_pin_mode_sonar(self, trigger_pin, echo_pin,
+                                 callback=None, timeout=80000):
+        """
+        This is a FirmataExpress feature.
+
+        Configure the pins,ping interval and maximum distance for an HC-SR04
+        type device.
+
+        :param trigger_pin: The pin number of for the trigger (transmitter).
+
+        :param echo_pin: The pin number for the received echo.
+
+        :param callback: optional callback function or coroutine to report
+                         sonar data changes
+
+        :param timeout: a tuning parameter. 80000UL equals 80ms.
+        """
+        if trigger_pin in self.active_sonar_map:
+            return
+
+        data = [trigger_pin, echo_pin, timeout & 0x7f, (timeout >> 7) & 0x7f]
+
+        await self._set_pin_mode(trigger_pin, PrivateConstants.SONAR)
+        await self._set_pin_mode(echo_pin, PrivateConstants.SONAR)
+        if len(self.active_sonar_map) > 6:
+            print('sonar_config: maximum number of devices assigned'
+                  ' - ignoring request')
+        else:
+            self.active_sonar_map[trigger_pin] = [callback, 0, 0]
+
+        await self._send_sysex(PrivateConstants.SONAR_CONFIG, data)
+
+    async def set_pin_mode_stepper(self, steps_per_revolution, stepper_pins):
+        """
+        This is a FirmataExpress feature.
+
+        Configure stepper motor prior to operation.
+
+        :param steps_per_revolution: number of steps per motor revolution
+
+        :param stepper_pins: a list of control pin numbers - either 4 or 2
+        """
+        data = [PrivateConstants.STEPPER_CONFIGURE,
+                steps_per_revolution & 0x7f,
+                (steps_per_revolution >> 7) & 0x7f]
+        data.extend(stepper_pins)
+        await self._send_sysex(PrivateConstants.STEPPER_DATA, data)
+
+    async def set_pin_mode_tone(self, pin_number):
+        """
+        This is FirmataExpress feature.
+
+        Set a PWM pin to tone mode.
+
+        :param pin_number: arduino pin number
+        """
+        await self._send_command([PrivateConstants.SET_PIN_MODE, pin_number,
+                                  PrivateConstants.TONE])
+
+    async def _set_pin_mode(self, pin_number, pin_state, callback=None,
+                            differential=1):
+        """
+        A private method to set the various pin modes.
+
+        :param pin_number: arduino pin number
+
+        :param pin_state: INPUT/OUTPUT/ANALOG/PWM/PULLUP/SONAR
+
+        :param callback: A reference to a call back function to be
+                         called when pin data value changes
+
+        :param differential: This value needs to be met for a callback
+                             to be invoked
+        """
+        if pin_state == PrivateConstants.PULLUP:
+            # changes are reported as PULLUP even without a callback
+            self.digital_pins[pin_number].pull_up = True
+
+        if callback:
+            if pin_state == PrivateConstants.INPUT:
+                self.digital_pins[pin_number].cb = callback
+            elif pin_state == PrivateConstants.PULLUP:
+                self.digital_pins[pin_number].cb = callback
+            elif pin_state == PrivateConstants.ANALOG:
+                self.analog_pins[pin_number].cb = callback
+                self.analog_pins[pin_number].differential = differential
+            else:
+                print('{} {}'.format('set_pin_mode: callback ignored for '
+                                     'pin state:', pin_state))
+
+        if pin_state == PrivateConstants.ANALOG:
+            pin_number = pin_number + self.first_analog_pin
+
+        await self._send_command([PrivateConstants.SET_PIN_MODE, pin_number, pin_state])
+
+        if pin_state == PrivateConstants.INPUT or pin_state == PrivateConstants.PULLUP:
+            await self.enable_digital_reporting(pin_number)
+
+    async def set_sampling_interval(self, interval):
+        """
+        This method sends the desired sampling interval to Firmata.
+
+        :param interval: Integer value for desired sampling interval
+                         in milliseconds
+        """
+        await self._send_sysex(PrivateConstants.SAMPLING_INTERVAL,
+                               [interval & 0x7f, (interval >> 7) & 0x7f])
+
+    async def servo_write(self, pin, position):
+        """
+        Set the position of a servo that has been previously configured
+        using set_pin_mode_servo.
+
+        :param pin: arduino pin number
+
+        :param position: servo position
+        """
+        await self.pwm_write(pin, position)
+
+    async def shutdown(self):
+        """
+        This method attempts an orderly shutdown
+        If any exceptions are thrown, they are ignored.
+        """
+        if self.shutdown_flag:
+            return
+        self.shutdown_flag = True
+        self.period = 0
+        if self.keep_alive_task:
+            self.keep_alive_task.cancel()
+
+        try:
+            if self.write_transport and not self.write_transport.is_closing():
+                for pin in range(len(self.analog_pins)):
+                    await self.disable_analog_reporting(pin)
+                for pin in range(len(self.digital_pins)):
+                    await self.disable_digital_reporting(pin)
+                await self.send_reset()
+                # allow the transport to flush
+                await asyncio.sleep(.05)
+        except (RuntimeError, OSError):
+            pass
+
+        for transport in (self.transport, self.write_transport):
+            if transport:
+                transport.close()
+
+        # release anybody waiting on a query
+        for futures in self.pending_replies.values():
+            for future in futures:
+                if not future.done():
+                    future.cancel()
+        self.pending_replies.clear()
+
+    async def sonar_read(self, trigger_pin):
+        """
+        This is a FirmataExpress feature
+
+        Retrieve Ping (HC-SR04 type) data.
+
+        :param trigger_pin: key into sonar data map
+
+        :returns: A list = [last value, raw time_stamp]
+        """
+        sonar_pin_entry = self.active_sonar_map.get(trigger_pin)
+        if sonar_pin_entry:
+            return [sonar_pin_entry[1], sonar_pin_entry[2]]
+        return [0, 0]
+
+    async def stepper_write(self, motor_speed, number_of_steps):
+        """
+        This is a FirmataExpress feature
+
+        Move a stepper motor for the number of steps at the specified speed.
+
+        :param motor_speed: 21 bits of data to set motor speed
+
+        :param number_of_steps: 14 bits for number of steps & direction
+                                positive is forward, negative is reverse
+        """
+        direction = 1 if number_of_steps > 0 else 0
+        abs_number_of_steps = abs(number_of_steps)
+        data = [PrivateConstants.STEPPER_STEP, motor_speed & 0x7f,
+                (motor_speed >> 7) & 0x7f, (motor_speed >> 14) & 0x7f,
+                abs_number_of_steps & 0x7f, (abs_number_of_steps >> 7) & 0x7f,
+                direction]
+        await self._send_sysex(PrivateConstants.STEPPER_DATA, data)
+
+    '''
+    query support
+    '''
+
+    def _expect_reply(self, key):
+        """
+        Register interest in a reply. This must be called before the
+        request is sent.
+
+        :param key: reply command or (reply command, pin)
+
+        :returns: a future resolved with the reply
+        """
+        future = self.loop.create_future()
+        self.pending_replies.setdefault(key, []).append(future)
+        return future
+
+    def _resolve_reply(self, key, value):
+        """
+        Resolve the oldest future waiting for this reply.
+        Unsolicited replies are ignored.
+        """
+        futures = self.pending_replies.get(key)
+        while futures:
+            future = futures.pop(0)
+            if not future.done():
+                future.set_result(value)
+                break
+        if futures == []:
+            del self.pending_replies[key]
+
+    async def _wait_for_reply(self, key, future, timeout):
+        """
+        :returns: the reply or None if the timeout expired
+        """
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            futures = self.pending_replies.get(key)
+            if futures and future in futures:
+                futures.remove(future)
+                if not futures:
+                    del self.pending_replies[key]
+            return None
+
+    async def _query(self, key, sysex_command, sysex_data=None, timeout=4):
+        """
+        Send a sysex query and wait for its reply.
+
+        :returns: the reply or None if the timeout expired
+        """
+        future = self._expect_reply(key)
+        await self._send_sysex(sysex_command, sysex_data)
+        return await self._wait_for_reply(key, future, timeout)
+
+    '''
+    Firmata message handlers
+    '''
+
+    def _run_callback(self, callback, message):
+        """
+        Invoke a user callback. Coroutine functions are scheduled as tasks.
+        """
+        if asyncio.iscoroutinefunction(callback):
+            self.loop.create_task(callback(message))
+        else:
+            callback(message)
+
+    def _analog_mapping_response(self, data):
+        self._resolve_reply(PrivateConstants.ANALOG_MAPPING_RESPONSE, list(data))
+
+    def _analog_message(self, data):
+        pin = data[0]
+        value = (data[PrivateConstants.MSB] << 7) + data[PrivateConstants.LSB]
+        if pin >= len(self.analog_pins):
+            return
+        pin_data = self.analog_pins[pin]
+        if abs(value - pin_data.current_value) >= pin_data.differential:
+            time_stamp = time.time()
+            pin_data.current_value = value
+            pin_data.event_time = time_stamp
+            if pin_data.cb:
+                self._run_callback(pin_data.cb,
+                                   [PrivateConstants.ANALOG, pin, value, time_stamp])
+
+    def _capability_response(self, data):
+        self._resolve_reply(PrivateConstants.CAPABILITY_RESPONSE, list(data))
+
+    def _dht_read_response(self, data):
+        time_stamp = time.time()
+        pin = data[0]
+        humidity = temperature = 0
+        if data[2] == 0:
+            humidity = float(data[5] + data[6] / 100)
+            if data[3]:
+                humidity *= -1.0
+            temperature = float(data[7] + data[8] / 100)
+            if data[4]:
+                temperature *= -1.0
+
+        pin_data = self.digital_pins[pin]
+        last_value = pin_data.current_value
+        pin_data.event_time = time_stamp
+        pin_data.current_value = [humidity, temperature]
+        if pin_data.cb:
+            reply_data = [PrivateConstants.DHT, pin, data[1], data[2], humidity,
+                          temperature, time_stamp]
+            if last_value[0] != humidity:
+                if abs(humidity - last_value[0]) >= pin_data.differential:
+                    self._run_callback(pin_data.cb, reply_data)
+            elif last_value[1] != temperature:
+                if abs(temperature - last_value[1]) >= pin_data.differential:
+                    self._run_callback(pin_data.cb, reply_data)
+
+    def _digital_message(self, data):
+        port = data[0]
+        port_data = (data[PrivateConstants.MSB] << 7) + data[PrivateConstants.LSB]
+        changed_mask = port_data ^ self.digital_port_values[port]
+        if not changed_mask:
+            return
+        self.digital_port_values[port] = port_data
+
+        first_pin = port * 8
+        time_stamp = time.time()
+        changed = changed_mask
+        while changed:
+            lowest_bit = changed & -changed
+            changed ^= lowest_bit
+            pin = first_pin + lowest_bit.bit_length() - 1
+            if pin >= len(self.digital_pins):
+                break
+            pin_data = self.digital_pins[pin]
+            if type(pin_data.current_value) is list:
+                continue
+            value = 1 if port_data & lowest_bit else 0
+            pin_data.current_value = value
+            pin_data.event_time = time_stamp
+            if pin_data.cb:
+                pin_type = PrivateConstants.PULLUP if pin_data.pull_up \
+                    else PrivateConstants.INPUT
+                self._run_callback(pin_data.cb, [pin_type, pin, value, time_stamp])
+
+        port_cb = self.digital_port_callbacks[port]
+        if port_cb:
+            self._run_callback(port_cb, [PrivateConstants.INPUT, port, port_data,
+                                         changed_mask, time_stamp])
+
+    def _i2c_reply(self, data):
+        address = (data[0] & 0x7f) + (data[1] << 7)
+        map_entry = self.i2c_map.get(address)
+        if map_entry is None:
+            return
+        reply_data = [PrivateConstants.I2C]
+        for i in range(0, len(data), 2):
+            reply_data.append((data[i] & 0x7f) + (data[i + 1] << 7))
+        current_time = time.time()
+        reply_data.append(current_time)
+        map_entry['value'] = reply_data[3:]
+        map_entry['time_stamp'] = current_time
+        cb = map_entry.get('callback')
+        if cb:
+            self._run_callback(cb, reply_data)
+
+    def _pin_state_response(self, data):
+        self._resolve_reply((PrivateConstants.PIN_STATE_RESPONSE, data[0]), list(data))
+
+    def _report_firmware(self, sysex_data):
+        version_string = f'{sysex_data[0]}.{sysex_data[1]} '
+        name = iter(sysex_data[2:])
+        for e in name:
+            version_string += chr(e + (next(name) << 7))
+        self._resolve_reply(PrivateConstants.REPORT_FIRMWARE, version_string)
+
+    def _report_version(self, data):
+        self._resolve_reply(PrivateConstants.REPORT_VERSION, f'{data[0]}.{data[1]}')
+
+    def _sonar_data(self, data):
+        pin_number = data[0]
+        val = (data[PrivateConstants.MSB] << 7) + data[PrivateConstants.LSB]
+        sonar_pin_entry = self.active_sonar_map.get(pin_number)
+        if sonar_pin_entry is None or sonar_pin_entry[1] == val:
+            return
+        time_stamp = time.time()
+        sonar_pin_entry[1] = val
+        sonar_pin_entry[2] = time_stamp
+        if sonar_pin_entry[0]:
+            self._run_callback(sonar_pin_entry[0],
+                               [PrivateConstants.SONAR, pin_number, val, time_stamp])
+
+    # noinspection PyMethodMayBeStatic
+    def _string_data(self, data):
+        print(''.join(chr(x) for x in data if x))
+
+    '''
+    transport support
+    '''
+
+    def _connection_lost(self, protocol, exc):
+        if protocol is self.protocol and not self.shutdown_flag:
+            print(f'pymata4: connection to the board was lost {exc or ""}')
+
+    async def _send_command(self, command):
+        """
+        Send a non-sysex command to Firmata.
+
+        :param command:  command data
+        """
+        if self.write_transport is None or self.write_transport.is_closing():
+            raise RuntimeError('write fail in _send_command')
+        self.write_transport.write(bytes(command))
+
+    async def _send_sysex(self, sysex_command, sysex_data=None):
+        """
+        Send a sysex command to Firmata.
+
+        :param sysex_command: sysex command
+
+        :param sysex_data: data for command
+        """
+        the_command = [PrivateConstants.START_SYSEX, sysex_command]
+        if sysex_data:
+            the_command.extend(sysex_data)
+        the_command.append(PrivateConstants.END_SYSEX)
+        await self._send_command(the_command)
@@ -0,0 +1,195 @@
+"""
+ Copyright (c) 2020 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import threading
+import time
+
+
+class WriteQueue:
+    """
+    Encoded frames waiting to be sent by the writer thread.
+
+    Frames are sent in the order they are queued. All frames waiting
+    when the writer wakes up are joined and sent as one batch.
+
+    A frame may be queued with a key, such as ('pwm', pin). If
+    latest_value_wins is set and a frame with the same key is still
+    waiting, the older frame is removed and the new one is queued in its
+    place at the end, so only the latest value is sent.
+
+    A key may also be given a rate limit. Frames for that key are held
+    back and at most one, the most recent, is sent per interval.
+    """
+
+    def __init__(self, latest_value_wins=False):
+        """
+        :param latest_value_wins: coalesce keyed frames that are waiting
+        """
+        self.latest_value_wins = latest_value_wins
+
+        self.the_write_condition = threading.Condition()
+
+        # frames waiting to be written. A removed frame is replaced
+        # with an empty bytes object.
+        self.frames = []
+
+        # key: index in frames of the waiting frame for that key
+        self.keyed_frames = {}
+
+        # key: minimum number of seconds between frames
+        self.rate_limits = {}
+
+        # key: latest frame held back by a rate limit
+        self.held_frames = {}
+
+        # key: time.monotonic() at which the last frame was sent
+        self.last_sent = {}
+
+        # statistics
+        self.frames_queued = 0
+        self.frames_merged = 0
+        self.batches = 0
+
+        # key: number of frames discarded in favor of a later value
+        self.merged_by_key = {}
+
+    def set_rate_limit(self, key, max_rate):
+        """
+        Limit the number of frames sent for a key.
+
+        :param key: frame key, such as ('pwm', pin)
+
+        :param max_rate: maximum number of frames per second.
+                         None or 0 removes the limit.
+        """
+        with self.the_write_condition:
+            if max_rate:
+                self.rate_limits[key] = 1 / max_rate
+            else:
+                self.rate_limits.pop(key, None)
+                held = self.held_frames.pop(key, None)
+                if held is not None:
+                    self._append(held, key)
+            self.the_write_condition.notify()
+
+    def put(self, frame, key=None):
+        """
+        Queue a frame.
+
+        :param frame: encoded bytes
+
+        :param key: Optional key. See the class description.
+        """
+        with self.the_write_condition:
+            self.frames_queued += 1
+            if key is not None:
+                if key in self.rate_limits:
+                    if key in self.held_frames:
+                        self._merged(key)
+                    self.held_frames[key] = frame
+                    self.the_write_condition.notify()
+                    return
+            self._append(frame, key)
+            self.the_write_condition.notify()
+
+    def _append(self, frame, key):
+        """
+        Add a frame to the end of the frames to be sent, replacing a
+        waiting frame with the same key if latest_value_wins is set.
+        The caller must hold the_write_condition.
+
+        :param frame: encoded bytes
+
+        :param key: frame key or None
+        """
+        if key is not None and self.latest_value_wins:
+            index = self.keyed_frames.get(key)
+            if index is not None:
+                self.frames[index] = b''
+                self._merged(key)
+            self.keyed_frames[key] = len(self.frames)
+        self.frames.append(frame)
+
+    def _merged(self, key):
+        self.frames_merged += 1
+        self.merged_by_key[key] = self.merged_by_key.get(key, 0) + 1
+
+    def get_batch(self, timeout=None):
+        """
+        Remove and return every frame that may be sent now as a single
+        bytes object. If there is nothing to send, block until there is.
+
+        :param timeout: maximum number of seconds to block
+
+        :returns: bytes, which are empty if the timeout expired
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.the_write_condition:
+            while True:
+                now = time.monotonic()
+                next_due = self._release_held_frames(now)
+                if self.frames:
+                    break
+                if deadline is not None and now >= deadline:
+                    return b''
+                wait_until = min([t for t in (deadline, next_due) if t is not None],
+                                 default=None)
+                self.the_write_condition.wait(
+                    None if wait_until is None else wait_until - now)
+
+            frames = self.frames
+            self.frames = []
+            self.keyed_frames = {}
+            self.batches += 1
+        return b''.join(frames)
+
+    def _release_held_frames(self, now):
+        """
+        Move the held frames whose interval has expired to the end of
+        the frames list. The caller must hold the_write_condition.
+
+        :param now: time.monotonic()
+
+        :returns: the time at which the next held frame is due, or None
+        """
+        next_due = None
+        for key in list(self.held_frames):
+            due_time = self.last_sent.get(key, 0) + self.rate_limits[key]
+            if due_time <= now:
+                self._append(self.held_frames.pop(key), key)
+                self.last_sent[key] = now
+            elif next_due is None or due_time < next_due:
+                next_due = due_time
+        return next_due
+
+    def flush_held(self):
+        """
+        Release every held frame regardless of its rate limit.
+        Used during shutdown.
+        """
+        with self.the_write_condition:
+            for key, frame in self.held_frames.items():
+                self._append(frame, key)
+            self.held_frames.clear()
+            self.the_write_condition.notify()
+
+    def wake(self):
+        """
+        Wake up a writer blocked in get_batch.
+        """
+        with self.the_write_condition:
+            self.the_write_condition.notify_all()
@@ -0,0 +1,72 @@
+"""
+ Copyright (c) 2020 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+from pymata4.firmata_parser import FirmataParser
+from pymata4.private_constants import PrivateConstants
+
+
+def test_analog_and_digital_messages():
+    parser = FirmataParser()
+    messages = parser.feed(bytes([0xe3, 0x10, 0x02, 0x91, 0x05, 0x00]))
+    assert messages == [(PrivateConstants.ANALOG_MESSAGE, (3, 0x10, 0x02)),
+                        (PrivateConstants.DIGITAL_MESSAGE, (1, 0x05, 0x00))]
+
+
+def test_message_split_across_chunks():
+    parser = FirmataParser()
+    data = bytes([0xe0, 0x7f, 0x07, 0xf0, 0x79, 0x01, 0x02, 0x46, 0x00, 0xf7])
+    messages = []
+    for byte in data:
+        messages += parser.feed(bytes([byte]))
+    assert messages == [(PrivateConstants.ANALOG_MESSAGE, (0, 0x7f, 0x07)),
+                        (PrivateConstants.REPORT_FIRMWARE, bytes([0x01, 0x02, 0x46, 0x00]))]
+    assert not parser.buffer
+
+
+def test_report_version():
+    parser = FirmataParser()
+    assert parser.feed(bytes([0xf9, 0x02, 0x05])) == [(PrivateConstants.REPORT_VERSION, (2, 5))]
+
+
+def test_unknown_sysex_discarded():
+    parser = FirmataParser({PrivateConstants.REPORT_FIRMWARE})
+    messages = parser.feed(bytes([0xf0, 0x6b, 0x01, 0xf7, 0xf0, 0x79, 0x01, 0xf7]))
+    assert messages == [(PrivateConstants.REPORT_FIRMWARE, bytes([0x01]))]
+    assert parser.discarded_messages == 1
+
+
+def test_resynchronize_on_stray_bytes():
+    parser = FirmataParser()
+    # a stray data byte, then an analog message interrupted by a new command
+    messages = parser.feed(bytes([0x05, 0xe1, 0x10, 0xe2, 0x01, 0x00]))
+    assert messages == [(PrivateConstants.ANALOG_MESSAGE, (2, 0x01, 0x00))]
+    assert parser.discarded_bytes == 3
+
+
+def test_oversized_sysex_discarded():
+    parser = FirmataParser()
+    chunk = bytes([0xf0, 0x71]) + bytes(FirmataParser.MAX_SYSEX_LENGTH)
+    assert parser.feed(chunk) == []
+    assert parser.discarded_bytes == len(chunk)
+    assert parser.feed(bytes([0xe0, 0x01, 0x00])) == [(PrivateConstants.ANALOG_MESSAGE, (0, 1, 0))]
+
+
+def test_reset_discards_partial_message():
+    parser = FirmataParser()
+    parser.feed(bytes([0xe0, 0x01]))
+    parser.reset()
+    assert parser.feed(bytes([0x00, 0xe0, 0x02, 0x00])) == [(PrivateConstants.ANALOG_MESSAGE, (0, 2, 0))]
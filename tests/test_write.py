@@ -0,0 +1,99 @@
+"""
+ Copyright (c) 2020 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import threading
+
+import pytest
+
+from pymata4 import pymata4
+from pymata4.write_queue import WriteQueue
+
+
+class RecordingPort:
+    """
+    A serial port that records what is written to it. When stall is
+    set, it accepts the first two bytes of a write and nothing after that.
+    """
+
+    def __init__(self, stall=False):
+        self.stall = stall
+        self.written = b''
+
+    def write(self, data):
+        if self.stall:
+            data = data[:2] if not self.written else b''
+        self.written += data
+        return len(data)
+
+
+def make_board(port):
+    """
+    A Pymata4 instance with just enough state to send commands.
+    """
+    board = pymata4.Pymata4.__new__(pymata4.Pymata4)
+    board.ip_address = None
+    board.serial_port = port
+    board.shutdown_on_exception = False
+    board.shutdown_flag = False
+    board.connection_lost = False
+    board.the_send_lock = threading.RLock()
+    board.the_write_queue = WriteQueue()
+    board.the_writer_thread = None
+    board.writer_running = False
+    return board
+
+
+def test_stalled_write_fails():
+    board = make_board(RecordingPort(stall=True))
+    board.WRITE_STALL_TIMEOUT = .05
+    with pytest.raises(RuntimeError):
+        board._send_command([0xf4, 3, 1])
+    # the send lock was released
+    assert board.the_send_lock.acquire(timeout=1)
+    board.the_send_lock.release()
+
+
+def test_stop_writer_sends_waiting_commands():
+    port = RecordingPort()
+    board = make_board(port)
+    board.the_writer_thread = threading.Thread(target=board._writer)
+    board.writer_running = True
+    board.the_writer_thread.start()
+    board._send_command([0xf4, 3, 1])
+    board._stop_writer()
+    assert not board.the_writer_thread.is_alive()
+
+    # a command queued after the writer thread exited is still sent
+    board.writer_running = True
+    board.the_write_queue.put(bytes([0xf4, 4, 1]))
+    board._stop_writer()
+    assert port.written == bytes([0xf4, 3, 1, 0xf4, 4, 1])
+
+
+def test_command_sent_when_writer_stops_during_put():
+    port = RecordingPort()
+    board = make_board(port)
+    board.writer_running = True
+
+    def put(frame, key=None):
+        WriteQueue.put(board.the_write_queue, frame, key)
+        board.writer_running = False
+
+    board.the_write_queue.put = put
+    board._send_command([0xf4, 3, 1])
+    assert port.written == bytes([0xf4, 3, 1])
+    assert not board.the_write_queue.frames
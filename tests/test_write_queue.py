@@ -0,0 +1,109 @@
+"""
+ Copyright (c) 2020 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import threading
+import time
+
+from pymata4.write_queue import WriteQueue
+
+
+def test_frames_joined_in_order():
+    queue = WriteQueue()
+    queue.put(b'\x01')
+    queue.put(b'\x02\x03')
+    assert queue.get_batch(0) == b'\x01\x02\x03'
+    assert queue.get_batch(0) == b''
+    assert queue.batches == 1
+
+
+def test_keyed_frame_replaced():
+    queue = WriteQueue(latest_value_wins=True)
+    queue.put(b'\x01', ('pwm', 3))
+    queue.put(b'\x02')
+    queue.put(b'\x03', ('pwm', 3))
+    queue.put(b'\x04', ('pwm', 5))
+    assert queue.get_batch(0) == b'\x02\x03\x04'
+    assert queue.frames_queued == 4
+    assert queue.frames_merged == 1
+
+    # keys do not carry over to the next batch
+    queue.put(b'\x05', ('pwm', 3))
+    assert queue.get_batch(0) == b'\x05'
+
+
+def test_keyed_frames_kept_without_latest_value_wins():
+    queue = WriteQueue()
+    queue.put(b'\x01', ('pwm', 3))
+    queue.put(b'\x02', ('pwm', 3))
+    assert queue.get_batch(0) == b'\x01\x02'
+    assert queue.frames_merged == 0
+
+
+def test_get_batch_blocks_until_put():
+    queue = WriteQueue()
+    timer = threading.Timer(.05, queue.put, (b'\x01',))
+    timer.start()
+    start = time.monotonic()
+    assert queue.get_batch(5) == b'\x01'
+    assert time.monotonic() - start < 5
+    timer.join()
+
+
+def test_get_batch_timeout():
+    assert WriteQueue().get_batch(.01) == b''
+
+
+def test_rate_limit_sends_latest_value_per_interval():
+    queue = WriteQueue()
+    queue.set_rate_limit(('pwm', 3), 20)
+    # the first value is sent at once
+    queue.put(b'\x01', ('pwm', 3))
+    assert queue.get_batch(0) == b'\x01'
+
+    # later values are held until the interval expires
+    queue.put(b'\x02', ('pwm', 3))
+    queue.put(b'\x03', ('pwm', 3))
+    queue.put(b'\x04')
+    assert queue.get_batch(0) == b'\x04'
+    start = time.monotonic()
+    assert queue.get_batch(1) == b'\x03'
+    assert .02 < time.monotonic() - start < .5
+    assert queue.merged_by_key == {('pwm', 3): 1}
+
+
+def test_removing_rate_limit_releases_held_frame():
+    queue = WriteQueue(latest_value_wins=True)
+    queue.set_rate_limit(('pwm', 3), 1)
+    queue.put(b'\x01', ('pwm', 3))
+    queue.get_batch(0)
+    queue.put(b'\x02', ('pwm', 3))
+    queue.set_rate_limit(('pwm', 3), None)
+    # the released frame is coalesced with later values
+    queue.put(b'\x03', ('pwm', 3))
+    assert queue.get_batch(0) == b'\x03'
+    assert queue.keyed_frames == {}
+
+
+def test_flush_held():
+    queue = WriteQueue()
+    queue.set_rate_limit(('servo', 9), 1)
+    queue.put(b'\x01', ('servo', 9))
+    queue.get_batch(0)
+    queue.put(b'\x02', ('servo', 9))
+    assert queue.get_batch(0) == b''
+    queue.flush_held()
+    assert queue.get_batch(0) == b'\x02'